@@ -1,9 +1,4 @@
 #!/usr/bin/env bash
-
-echo "Building CSV from raw data..."
-python3 src/build_csv.py --input data/raw/ --output data/output.csv
-
-echo "Transforming data..."
-python3 src/data_transformation.py --input data/output.csv --output data/data_transformed.csv
-
-echo "Data transformation complete. Transformed data saved to data/data_transformed.csv"
\ No newline at end of file
+# Stages whose inputs, parameters and code did not change since the last run are skipped,
+# see src/pipeline.py. Pass stage names to only build those, e.g. ./run.sh heatmap
+exec python3 src/pipeline.py "$@"
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+UNKNOWN_CAR = "unknown"
+NOT_ANNOTATED = "NOT_ANNOTATED"
+
+CAR_TYPES = {
+    "1": {"model":"Renault Zoe","type":"car"},
+    "2": {"model":"Renault Zoe","type":"car"},
+    "6": {"model":"unknown","type":"van"},
+    "9":  {"model":"Renault Zoe","type":"car"},
+    "10": {"model":"Renault Zoe","type":"car"},
+    "14": {"model":"Renault Zoe","type":"car"},
+    "25": {"model":"unknown","type":"van"},
+    "26": {"model":"Renault Zoe","type":"car"},
+    "31": {"model":"unknown","type":"van"},
+    "32": {"model":"SAIC Motor MAXUS E-Deliver 3","type":"van"},
+    "34": {"model":"Renault Zoe","type":"car"},
+    "35": {"model":"Renault Zoe","type":"car"},
+    "57": {"model":"Renault Zoe","type":"car"},
+    "64": {"model":"Renault Zoe","type":"car"},
+    "74": {"model":"unknown","type":"van"},
+    "76": {"model":"Mercedes eVito","type":"van"},
+    "77": {"model":"Renault Zoe","type":"car"},
+    "79": {"model":"Peugeot e-Partner","type":"van"},
+    "86": {"model":"Renault Zoe","type":"car"},
+    "91": {"model":"Renault Zoe","type":"car"},
+    "94": {"model":"Renault Zoe","type":"car"},
+    "95": {"model":"Renault Kangoo","type":"van"},
+    "96": {"model":"Renault Zoe","type":"car"},
+    "97": {"model":"Renault Zoe","type":"car"},
+    "99": {"model":"Renault Zoe","type":"car"},
+    "102": {"model":"Renault Megane","type":"car"},
+    "103": {"model":"Opel Vivaro Electric","type":"van"},
+    "105": {"model":"Renault Zoe","type":"car"},
+    "106": {"model":"Renault Zoe","type":"car"},
+    "107": {"model":"Renault Zoe","type":"car"},
+    "109": {"model":"Renault Trafic E-Tech","type":"van"},
+    "111": {"model":"Ford E-Transit","type":"van"}
+}
+
+POST_CODES = {
+    1: {"name": "Bronshoj",         "zip_from": 2700, "zip_to": 2700, "setting": 2700},
+    2: {"name": "Kobenhavn K",      "zip_from": 1050, "zip_to": 1473, "setting": 1050},
+    3: {"name": "Kobenhavn N",      "zip_from": 2200, "zip_to": 2200, "setting": 2200},
+    4: {"name": "Kobenhavn NV",     "zip_from": 2400, "zip_to": 2400, "setting": 2400},
+    5: {"name": "Kobenhavn O",      "zip_from": 2100, "zip_to": 2100, "setting": 2100},
+    6: {"name": "Kobenhavn S",      "zip_from": 2300, "zip_to": 2300, "setting": 2300},
+    7: {"name": "Kobenhavn SV",     "zip_from": 2450, "zip_to": 2450, "setting": 2450},
+    8: {"name": "Kobenhavn V",      "zip_from": 1550, "zip_to": 1799, "setting": 1550},
+    9: {"name": "Nordhavn",         "zip_from": 2150, "zip_to": 2150, "setting": 2150},
+    10: {"name": "Valby",           "zip_from": 2500, "zip_to": 2500, "setting": 2500},
+    11: {"name": "Vanlose",         "zip_from": 2720, "zip_to": 2720, "setting": 2720},
+    12: {"name": "Frederiksberg C", "zip_from": 1800, "zip_to": 2000, "setting": 2000},
+    13: {"name": "Hellerup",        "zip_from": 2900, "zip_to": 2900, "setting": 2900},
+    14: {"name": "Soborg",          "zip_from": 2860, "zip_to": 2860, "setting": 2860},
+    15: {"name": "Herlev",          "zip_from": 2730, "zip_to": 2730, "setting": 2730},
+    16: {"name": "Skovlunde",       "zip_from": 2740, "zip_to": 2740, "setting": 2740},
+    17: {"name": "Ballerup",        "zip_from": 2750, "zip_to": 2750, "setting": 2750},
+    18: {"name": "Glostrup",        "zip_from": 2600, "zip_to": 2600, "setting": 2600},
+    19: {"name": "Hvidovre",        "zip_from": 2650, "zip_to": 2650, "setting": 2650},
+    20: {"name": "Albertslund",     "zip_from": 2620, "zip_to": 2620, "setting": 2620},
+    21: {"name": "Taastrup",        "zip_from": 2630, "zip_to": 2630, "setting": 2630},
+    22: {"name": "Brondby Strand",  "zip_from": 2660, "zip_to": 2660, "setting": 2660},
+    23: {"name": "Kgs. Lyngby",     "zip_from": 2800, "zip_to": 2800, "setting": 2800},
+    24: {"name": "Virum",           "zip_from": 2830, "zip_to": 2830, "setting": 2830},
+    25: {"name": "Dyssegoord",      "zip_from": 2870, "zip_to": 2870, "setting": 2870},
+    26: {"name": "Gentofte",        "zip_from": 2820, "zip_to": 2820, "setting": 2820},
+    27: {"name": "Rodovre",         "zip_from": 2610, "zip_to": 2610, "setting": 2610},
+    28: {"name": "Kastrup",         "zip_from": 2770, "zip_to": 2770, "setting": 2770},
+    29: {"name": "Charlottelund",   "zip_from": 2920, "zip_to": 2920, "setting": 2920},
+    30: {"name": "Klampenborg",     "zip_from": 2930, "zip_to": 2930, "setting": 2930},
+    31: {"name": "Bagsvaerd",       "zip_from": 2880, "zip_to": 2880, "setting": 2880}
+}
+
+
+def id_to_car_type(vehicle_type_id):
+    return CAR_TYPES[vehicle_type_id]["type"] if vehicle_type_id in CAR_TYPES else UNKNOWN_CAR
+
+
+def id_to_car_model(vehicle_type_id):
+    return CAR_TYPES[vehicle_type_id]["model"] if vehicle_type_id in CAR_TYPES else UNKNOWN_CAR
+
+
+def postcode_mapping(zip_code):
+    for code, info in POST_CODES.items():
+        if info["zip_from"] <= zip_code <= info["zip_to"]:
+            return info["name"]
+    return NOT_ANNOTATED
+
+
+class VehicleTypeLookup:
+    """CAR_TYPES compiled into direct-index arrays: vehicle type id -> code -> label."""
+
+    def __init__(self, car_types=CAR_TYPES):
+        ids = np.array([int(k) for k in car_types], dtype=np.int64)
+        self.types = np.array([UNKNOWN_CAR] + [v["type"] for v in car_types.values()], dtype=object)
+        self.models = np.array([UNKNOWN_CAR] + [v["model"] for v in car_types.values()], dtype=object)
+        # Code 0 is "unknown"; ids are small, so a dense table indexed by id is tiny
+        self.codes = np.zeros(ids.max() + 1, dtype=np.int32)
+        self.codes[ids] = np.arange(1, len(ids) + 1, dtype=np.int32)
+
+    def lookup_codes(self, vehicle_type_ids):
+        """Codes for a Series of ids, matching CAR_TYPES keys exactly like id_to_car_type.
+
+        String ids must be the canonical decimal form ("91", not "91.0" or " 91"); integer
+        ids are looked up directly.
+        """
+        values, uniques = pd.factorize(pd.Series(vehicle_type_ids), use_na_sentinel=True)
+        if pd.api.types.is_integer_dtype(uniques.dtype):
+            ids = np.array(uniques, dtype=np.int64)
+        else:
+            text = pd.Series(uniques, dtype=object).astype(str)
+            ids = pd.to_numeric(text, errors="coerce").fillna(-1).to_numpy(dtype=np.int64, copy=True)
+            # Only exact keys match, e.g. "91.0" or "091" are unknown
+            ids[ids.astype(str) != text.to_numpy(dtype=str)] = -1
+        valid = (ids >= 0) & (ids < len(self.codes))
+        unique_codes = np.zeros(len(ids), dtype=np.int32)
+        unique_codes[valid] = self.codes[ids[valid]]
+        # factorize marks missing values with -1, which then maps to "unknown"
+        return np.where(values >= 0, unique_codes[values], 0)
+
+    def car_types(self, vehicle_type_ids):
+        return self.types[self.lookup_codes(vehicle_type_ids)]
+
+    def car_models(self, vehicle_type_ids):
+        return self.models[self.lookup_codes(vehicle_type_ids)]
+
+
+class PostcodeLookup:
+    """POST_CODES compiled into sorted, non-overlapping zip intervals for a searchsorted lookup."""
+
+    def __init__(self, post_codes=POST_CODES):
+        intervals = sorted((v["zip_from"], v["zip_to"], v["name"]) for v in post_codes.values())
+        self.starts = np.array([start for start, _, _ in intervals], dtype=np.float64)
+        self.ends = np.array([end for _, end, _ in intervals], dtype=np.float64)
+        # postcode_mapping returns the first match; with no overlaps that is the only match
+        if np.any(self.starts[1:] <= self.ends[:-1]):
+            raise ValueError("Postcode ranges overlap")
+        self.names = np.array([name for _, _, name in intervals] + [NOT_ANNOTATED], dtype=object)
+
+    def area_names(self, zip_codes):
+        z = np.asarray(zip_codes, dtype=np.float64)
+        idx = np.searchsorted(self.starts, z, side="right") - 1
+        inside = (idx >= 0) & (z <= self.ends[np.maximum(idx, 0)])
+        return self.names[np.where(inside, idx, len(self.names) - 1)]
+
+
+VEHICLE_TYPES = VehicleTypeLookup()
+POSTCODES = PostcodeLookup()
+
+
+def car_types(vehicle_type_ids):
+    """Vectorized id_to_car_type."""
+    return VEHICLE_TYPES.car_types(vehicle_type_ids)
+
+
+def car_models(vehicle_type_ids):
+    """Vectorized id_to_car_model."""
+    return VEHICLE_TYPES.car_models(vehicle_type_ids)
+
+
+def area_names(zip_codes):
+    """Vectorized postcode_mapping."""
+    return POSTCODES.area_names(zip_codes)
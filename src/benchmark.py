@@ -0,0 +1,176 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from synthetic_fleet import generate
+
+logger = logging.getLogger(__name__)
+
+SRC = Path(__file__).resolve().parent
+WORK_DIR = "artifacts/benchmark"
+RESULTS = "artifacts/benchmark.json"
+SIZES = "100x180,500x720,2000x720"
+# A stage regresses if it gets this much slower or bigger than the baseline...
+TOLERANCE = 0.2
+# ...and the wall time grows by at least this many seconds, which keeps short stages from flapping
+MIN_WALL_DELTA_S = 0.5
+
+# Pipeline stages in order: script, arguments (relative to the dataset directory), input and output file
+STAGES = {
+    "build_csv": ("build_csv.py", ["--input", "raw", "--output", "combined.csv"], "raw", "combined.csv"),
+    "data_transformation": ("data_transformation.py", ["--input", "combined.csv", "--output", "transformed.csv"],
+                            "combined.csv", "transformed.csv"),
+    "cluster": ("cluster.py", ["--input", "transformed.csv"], "transformed.csv", None),
+    "heatmap": ("heatmap.py", ["--input", "transformed.csv"], "transformed.csv", None),
+}
+
+
+def _parse_sizes(value):
+    sizes = []
+    for size in value.split(","):
+        cars, snapshots = size.lower().split("x")
+        sizes.append((int(cars), int(snapshots)))
+    return sizes
+
+
+def _count_rows(path):
+    """Rows of a CSV, or of all snapshots in a directory of JSON files."""
+    path = Path(path)
+    if path.is_dir():
+        return sum(len(json.loads(p.read_bytes())) for p in path.glob("*.json"))
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def run_stage(argv, cwd, log_path):
+    """Run one stage as a child process; return its wall time and peak RSS in MB."""
+    started = time.perf_counter()
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(argv, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 gives the resource usage of this child alone
+        _, status, usage = os.wait4(proc.pid, 0)
+    wall_s = time.perf_counter() - started
+    returncode = os.waitstatus_to_exitcode(status)
+    if returncode != 0:
+        tail = Path(log_path).read_text(errors="replace").splitlines()[-20:]
+        raise RuntimeError(f"{' '.join(map(str, argv))} failed with exit code {returncode}:\n" + "\n".join(tail))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_kb = usage.ru_maxrss / 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return wall_s, rss_kb / 1024
+
+
+def _producer(path):
+    return next((name for name, stage in STAGES.items() if stage[3] == path), None)
+
+
+def benchmark(sizes, stages, work_dir=WORK_DIR, seed=0, repeat=1):
+    """Generate a dataset per size and run the selected stages on it; one result row per (size, stage).
+
+    A stage whose input is missing gets it from its producing stage first, unmeasured.
+    """
+    results = []
+    for cars, snapshots in sizes:
+        dataset = Path(work_dir) / f"cars{cars}_snapshots{snapshots}_seed{seed}"
+        if not (dataset / "raw").exists():
+            generate(dataset / "raw", cars, snapshots, seed)
+            logger.info(f"Generated {snapshots} snapshots of {cars} cars in {dataset}")
+        # The map scripts write to artifacts/ under their working directory
+        (dataset / "artifacts").mkdir(exist_ok=True)
+
+        def run(name, times):
+            script, args, source, _ = STAGES[name]
+            producer = _producer(source)
+            if producer and not (dataset / source).exists():
+                run(producer, 1)
+            argv = [sys.executable, str(SRC / script), *args]
+            return [run_stage(argv, dataset, dataset / f"{name}.log") for _ in range(times)]
+
+        for name in [s for s in STAGES if s in stages]:
+            runs = run(name, repeat)
+            wall_s = min(r[0] for r in runs)
+            rows = _count_rows(dataset / STAGES[name][2])
+            result = {
+                "stage": name,
+                "cars": cars,
+                "snapshots": snapshots,
+                "rows": rows,
+                "wall_s": round(wall_s, 3),
+                "rows_per_s": round(rows / wall_s, 1) if wall_s else None,
+                "peak_rss_mb": round(max(r[1] for r in runs), 1),
+            }
+            logger.info(
+                f"{name} on {cars} cars x {snapshots} snapshots: {rows} rows in {wall_s:.2f}s "
+                f"({result['rows_per_s']} rows/s), peak RSS {result['peak_rss_mb']} MB"
+            )
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Join the results to the baseline and flag stages that got slower or use more memory."""
+    keys = ["stage", "cars", "snapshots"]
+    merged = results.merge(baseline[keys + ["wall_s", "peak_rss_mb"]], on=keys, how="left", suffixes=("", "_baseline"))
+    merged["wall_change"] = merged["wall_s"] / merged["wall_s_baseline"] - 1
+    merged["rss_change"] = merged["peak_rss_mb"] / merged["peak_rss_mb_baseline"] - 1
+    slower = (merged["wall_change"] > tolerance) & (merged["wall_s"] - merged["wall_s_baseline"] >= MIN_WALL_DELTA_S)
+    merged["regression"] = slower | (merged["rss_change"] > tolerance)
+    return merged
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic fleets of increasing size.")
+    parser.add_argument('--sizes', type=str, default=SIZES, help="Comma-separated CARSxSNAPSHOTS dataset sizes.")
+    parser.add_argument('--stages', type=str, default=",".join(STAGES), help=f"Comma-separated stages out of {', '.join(STAGES)}.")
+    parser.add_argument('--work-dir', type=str, default=WORK_DIR, help="Where the generated datasets and stage outputs go.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic fleets.")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per stage; the fastest run is reported.")
+    parser.add_argument('--output', type=str, default=RESULTS, help="JSON file for the results.")
+    parser.add_argument('--baseline', type=str, help="Results JSON of an earlier run to compare against.")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Allowed relative slowdown or memory growth.")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - STAGES.keys()
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    results = benchmark(_parse_sizes(args.sizes), stages, args.work_dir, args.seed, args.repeat)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": _environment(), "results": results.to_dict(orient="records")}, f, indent=2)
+    logger.info(f"Saved benchmark results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = pd.DataFrame(json.load(f)["results"])
+        report = compare(results, baseline, args.tolerance)
+        columns = ["stage", "cars", "snapshots", "wall_s", "wall_s_baseline", "wall_change",
+                   "peak_rss_mb", "peak_rss_mb_baseline", "rss_change", "regression"]
+        print(report[columns].to_string(index=False, float_format=lambda v: f"{v:.3g}"))
+        regressions = report[report["regression"]]
+        if len(regressions):
+            logger.error(f"{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%} against {args.baseline}")
+            sys.exit(1)
+        logger.info(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
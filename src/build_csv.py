@@ -1,44 +1,64 @@
 import json
+import os
 import csv
-from pathlib import Path
+import gzip
+import io
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Iterator, NamedTuple
 import re
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import argparse
 import logging
+import shutil
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
+from instrumentation import Metrics, Progress, add_metrics_arguments
 
 logger = logging.getLogger(__name__)
  
  
 MAX_WORKERS = 16
 BATCH_SIZE = 5000
- 
 
-class ProgressTracker:
-    """Track and display progress for file processing."""
-    
-    def __init__(self, total: int, update_interval: int = 20):
-        self.total = total
-        self.completed = 0
-        self.update_interval = update_interval
-        self.last_reported = 0
-    
-    def update(self, increment: int = 1) -> None:
-        """Increment progress and print if threshold reached."""
-        self.completed += increment
-        
-        # Print on interval or when complete
-        if (self.completed - self.last_reported >= self.update_interval or 
-            self.completed == self.total):
-            self._print_progress()
-            self.last_reported = self.completed
-    
-    def _print_progress(self) -> None:
-        """Print current progress."""
-        percentage = (self.completed / self.total) * 100
-        print(f"Progress: {percentage:.1f}% ({self.completed}/{self.total} files)")
- 
+# Declared ingest schema: the columns of the combined table, in output order, with the
+# types used for --format parquet. Repeated strings are dictionary-encoded so they load
+# back as categoricals. Keys outside the schema are dropped while parsing.
+_DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+INGEST_SCHEMA = pa.schema([
+    ("carId", pa.int32()),
+    ("serviceType", pa.int16()),
+    ("title", _DICT_STRING),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("licencePlate", _DICT_STRING),
+    ("fuelLevel", pa.int16()),
+    ("vehicleStateId", pa.int16()),
+    ("vehicleTypeId", pa.int16()),
+    ("pricingTime", _DICT_STRING),
+    ("pricingParking", _DICT_STRING),
+    ("reservationState", pa.int16()),
+    ("isClean", pa.bool_()),
+    ("isDamaged", pa.bool_()),
+    ("distance", _DICT_STRING),
+    ("address", _DICT_STRING),
+    ("zipCode", _DICT_STRING),
+    ("city", _DICT_STRING),
+    ("locationId", pa.int16()),
+    ("file_datetime", pa.timestamp("s")),
+])
+INGEST_COLUMNS = INGEST_SCHEMA.names
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar.zst", ".tar.zstd")
+PARQUET_PARTITION_KEY = "date"
+PARQUET_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
  
+
 def _parse_datetime_from_filename(path: Path) -> str | None:
     """Extract datetime from filenames like 'cars_YYYYMMDD_HHMMSS.json'."""
     m = re.search(r"(\d{8}_\d{6})", path.name)
@@ -52,14 +72,166 @@ def _parse_datetime_from_filename(path: Path) -> str | None:
         return None
  
  
-def _read_single_file(fp: Path) -> tuple[list[dict], str] | None:
-    """Read a single JSON file and return data with filename."""
+class SnapshotRef(NamedTuple):
+    """A raw snapshot: a loose (optionally gzipped) file, a zip member or a streamed tar member."""
+    name: str  # base name, used for file_datetime and as the manifest key
+    path: Path  # the file itself, or the archive containing it
+    size: int
+    mtime_ns: int
+    member: str | None = None  # member name inside the archive
+    offset: int | None = None  # data offset of a member of an uncompressed tar
+    payload: bytes | None = None  # member bytes, for compressed tar members read from the stream
+
+
+def _is_snapshot_name(name: str) -> bool:
+    """Snapshots are '*.json' or '*.json.gz'; skips macOS resource forks found in zips."""
+    base = PurePosixPath(name).name
+    return base.endswith((".json", ".json.gz")) and not base.startswith("._") and "__MACOSX" not in name
+
+
+def _is_tar(path: Path) -> bool:
+    return path.name.endswith(TAR_SUFFIXES)
+
+
+def _is_streamed_tar(path: Path) -> bool:
+    """Compressed tars can only be read front to back; plain '.tar' members are read by offset."""
+    return _is_tar(path) and not path.name.endswith(".tar")
+
+
+def _open_tar_stream(path: Path) -> tarfile.TarFile:
+    """Open a tar archive for a single sequential pass; zstd is decompressed with `zstandard`."""
+    if path.name.endswith((".zst", ".zstd")):
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return tarfile.open(fileobj=stream, mode="r|")
+    return tarfile.open(path, mode="r|*")
+
+
+def _list_snapshots(input_path: Path) -> list[SnapshotRef]:
+    """List the snapshots in a directory, a zip archive or a tar archive without extracting them."""
+    if input_path.is_dir():
+        refs = []
+        for fp in input_path.iterdir():
+            if fp.is_file() and _is_snapshot_name(fp.name):
+                st = fp.stat()
+                refs.append(SnapshotRef(fp.name, fp, st.st_size, st.st_mtime_ns))
+        return refs
+    if _is_tar(input_path) and not _is_streamed_tar(input_path):
+        with tarfile.open(input_path, mode="r:") as tar:
+            return [
+                SnapshotRef(PurePosixPath(info.name).name, input_path, info.size, int(info.mtime) * 10**9,
+                            info.name, offset=info.offset_data)
+                for info in tar if info.isfile() and _is_snapshot_name(info.name)
+            ]
+    if _is_tar(input_path):
+        # Only headers are needed, but a compressed stream still has to be decompressed to find them
+        with _open_tar_stream(input_path) as tar:
+            return [
+                SnapshotRef(PurePosixPath(info.name).name, input_path, info.size, int(info.mtime) * 10**9, info.name)
+                for info in tar if info.isfile() and _is_snapshot_name(info.name)
+            ]
+    if zipfile.is_zipfile(input_path):
+        with zipfile.ZipFile(input_path) as zf:
+            return [
+                SnapshotRef(PurePosixPath(info.filename).name, input_path, info.file_size,
+                            int(datetime(*info.date_time).timestamp()) * 10**9, info.filename)
+                for info in zf.infolist() if not info.is_dir() and _is_snapshot_name(info.filename)
+            ]
+    raise ValueError(f"{input_path} is not a directory, zip or tar archive")
+
+
+# Open zip archives, one per archive path and process, reused across members
+_ZIP_ARCHIVES: dict[Path, zipfile.ZipFile] = {}
+
+
+def _open_snapshot(ref: SnapshotRef):
+    """Open a snapshot for binary reading, decompressing '.json.gz' transparently."""
+    if ref.payload is not None:
+        f = io.BytesIO(ref.payload)
+    elif ref.offset is not None:
+        with open(ref.path, 'rb') as archive:
+            archive.seek(ref.offset)
+            f = io.BytesIO(archive.read(ref.size))
+    elif ref.member is not None:
+        zf = _ZIP_ARCHIVES.get(ref.path)
+        if zf is None:
+            zf = _ZIP_ARCHIVES[ref.path] = zipfile.ZipFile(ref.path)
+        f = zf.open(ref.member)
+    else:
+        f = open(ref.path, 'rb')
+    if ref.name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    return f
+
+
+def _iter_batches(input_path: Path, refs: list[SnapshotRef], batch_size: int) -> Iterator[list[SnapshotRef]]:
+    """Yield batches of snapshot refs in the order of `refs`.
+
+    Compressed tar archives have no random access, so they are streamed once and members
+    are handed out with their bytes; each batch is sorted, but order across batches follows
+    the archive (create it with `tar --sort=name` to keep the output fully time-ordered).
+    """
+    if not _is_streamed_tar(input_path):
+        for i in range(0, len(refs), batch_size):
+            yield refs[i:i + batch_size]
+        return
+    wanted = {ref.member: ref for ref in refs}
+    last_key = None
+    warned = False
+
+    def ordered(batch: list[SnapshotRef]) -> list[SnapshotRef]:
+        nonlocal last_key, warned
+        batch.sort(key=_snapshot_sort_key)
+        if not warned and last_key is not None and _snapshot_sort_key(batch[0]) < last_key:
+            logger.warning(f"{input_path} is not in timestamp order; output is only ordered within batches")
+            warned = True
+        last_key = _snapshot_sort_key(batch[-1])
+        return batch
+
+    batch = []
+    with _open_tar_stream(input_path) as tar:
+        for info in tar:
+            ref = wanted.get(info.name)
+            if ref is None or not info.isfile():
+                continue
+            batch.append(ref._replace(payload=tar.extractfile(info).read()))
+            if len(batch) == batch_size:
+                yield ordered(batch)
+                batch = []
+    if batch:
+        yield ordered(batch)
+
+
+def _projecting_hook(columns: frozenset[str], seen: set[str]):
+    """Build a json object_pairs_hook that keeps only `columns` and records every key it meets."""
+    def hook(pairs):
+        obj = {}
+        for key, value in pairs:
+            seen.add(key)
+            if key in columns:
+                obj[key] = value
+        return obj
+    return hook
+
+
+def _read_single_file(ref: SnapshotRef, columns: frozenset[str] = frozenset(INGEST_COLUMNS),
+                      timings: dict | None = None) -> tuple[list[dict], str, set[str]] | None:
+    """Read a single JSON file, keeping only `columns` of each car object.
+
+    Returns the projected data with the filename and the set of all keys seen in the file.
+    If `timings` is given, the seconds spent reading and decoding and the bytes read are added to it.
+    """
+    seen = set()
     try:
-        with open(fp, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data, fp.name
+        t0, c0 = time.perf_counter(), time.thread_time()
+        with _open_snapshot(ref) as f:
+            raw = f.read()
+        t1, c1 = time.perf_counter(), time.thread_time()
+        data = json.loads(raw, object_pairs_hook=_projecting_hook(columns, seen))
+        if timings is not None:
+            timings.update(read=(t1 - t0, c1 - c0), decode=(time.perf_counter() - t1, time.thread_time() - c1), bytes=len(raw))
+        return data, ref.name, seen
     except Exception as exc:
-        print(f"Warning: failed to read {fp}: {exc}")
+        print(f"Warning: failed to read {ref.member or ref.path}: {exc}")
         return None
  
  
@@ -75,68 +247,437 @@ def _build_csv_line(row: dict, fieldnames: list[str], delimiter: str = ',', quot
         values.append(val_str)
     return delimiter.join(values) + '\n'
 
+
+class SchemaDriftReporter:
+    """Report snapshot keys outside the ingest schema and selected columns that are missing."""
+
+    def __init__(self, columns: list[str]):
+        # file_datetime comes from the filename, not from the snapshot itself
+        self.expected = set(columns) - {"file_datetime"}
+        self.reported = set()
+        self.reported_mistyped = set()
+        self.drifted_files = 0
+
+    def check(self, filename: str, keys: set[str], n_rows: int, mistyped: list[str] = ()) -> None:
+        """Warn once per drifted key; keys outside the schema are dropped, missing columns left empty.
+
+        `mistyped` are the columns with values that do not fit their schema type, which the
+        Parquet output writes as nulls.
+        """
+        if not n_rows:
+            return
+        unknown = keys.difference(INGEST_COLUMNS)
+        missing = self.expected - keys
+        if not unknown and not missing and not mistyped:
+            return
+        self.drifted_files += 1
+        new_unknown = sorted(unknown - self.reported)
+        new_missing = sorted(missing - self.reported)
+        new_mistyped = sorted(set(mistyped) - self.reported_mistyped)
+        if new_unknown:
+            logger.warning(f"{filename}: dropping keys outside the ingest schema: {', '.join(new_unknown)}")
+        if new_missing:
+            logger.warning(f"{filename}: missing columns left empty: {', '.join(new_missing)}")
+        if new_mistyped:
+            logger.warning(f"{filename}: values that do not fit the schema type set to null: {', '.join(new_mistyped)}")
+        self.reported.update(new_unknown, new_missing)
+        self.reported_mistyped.update(new_mistyped)
+
+    def summary(self) -> None:
+        """Log how many files deviated from the schema."""
+        if self.drifted_files:
+            logger.warning(f"Schema drift in {self.drifted_files} files")
+
+
+def _rows_from_snapshot(data: list[dict], filename: str) -> list[dict]:
+    """Tag every car object of a snapshot with the datetime parsed from its filename."""
+    file_dt = _parse_datetime_from_filename(Path(filename))
+    if file_dt:
+        for obj in data:
+            obj["file_datetime"] = file_dt
+    return data
+
+
+def _typed_value(value, type: pa.DataType):
+    """`value` if it converts to `type`, else None."""
+    try:
+        pa.array([value], type=type)
+        return value
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def _snapshot_table(data: list[dict], filename: str, columns: list[str]) -> tuple[pa.Table, list[str]]:
+    """Convert a projected snapshot to an Arrow table with the INGEST_SCHEMA types of `columns`.
+
+    Values that do not convert to their column's type (e.g. `"fuelLevel": "high"`) become
+    nulls, so one drifted snapshot does not abort the run. Returns the table and the
+    columns where that happened.
+    """
+    schema = pa.schema([INGEST_SCHEMA.field(c) for c in columns if c != "file_datetime"])
+    mistyped = []
+    try:
+        table = pa.Table.from_pylist(data, schema=schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        arrays = []
+        for field in schema:
+            values = [row.get(field.name) for row in data]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                mistyped.append(field.name)
+                arrays.append(pa.array([_typed_value(v, field.type) for v in values], type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=schema)
+    if "file_datetime" in columns:
+        file_dt = _parse_datetime_from_filename(Path(filename))
+        file_dt_col = pa.array([file_dt] * len(data), type=pa.string()).cast(pa.timestamp("s"))
+        table = table.add_column(columns.index("file_datetime"), INGEST_SCHEMA.field("file_datetime"), file_dt_col)
+    return table, mistyped
+
+
+def _table_to_ipc(table: pa.Table) -> bytes:
+    """Serialize a table to Arrow IPC stream bytes for handing back from a worker."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _encode_single_file(ref: SnapshotRef, columns: list[str],
+                        output_format: str = "csv") -> tuple[str, bytes, int, set[str], list[str], dict] | None:
+    """Parse a snapshot and encode it for the writer; runs in a worker thread or process.
+
+    Returns the filename, the encoded block (utf-8 CSV lines or an Arrow IPC stream),
+    its row count, all keys seen in the file, the columns whose mistyped values were
+    nulled (Parquet only) and the time spent per step.
+    """
+    timings = {}
+    result = _read_single_file(ref, frozenset(columns), timings)
+    if result is None:
+        return None
+    data, filename, keys = result
+    t0, c0 = time.perf_counter(), time.thread_time()
+    mistyped = []
+    if output_format == "parquet":
+        table, mistyped = _snapshot_table(data, filename, columns)
+        block = _table_to_ipc(table)
+    else:
+        if "file_datetime" in columns:
+            data = _rows_from_snapshot(data, filename)
+        block = ''.join([_build_csv_line(row, columns) for row in data]).encode('utf-8')
+    timings["format"] = (time.perf_counter() - t0, time.thread_time() - c0)
+    return filename, block, len(data), keys, mistyped, timings
+
+
+def _encode_files(executor, files: list[SnapshotRef], columns: list[str], output_format: str, max_workers: int,
+                  drift: SchemaDriftReporter, progress: Progress | None, metrics: Metrics):
+    """Yield (filename, block, n_rows) for each readable file, in the order of `files`.
+
+    The workers' read, decode and format times (wall and thread cpu) are added to `metrics`.
+    """
+    chunksize = max(1, len(files) // (max_workers * 4))
+    # map() yields in submission order, i.e. snapshot-timestamp order
+    results = executor.map(_encode_single_file, files, repeat(columns), repeat(output_format), chunksize=chunksize)
+    for result in results:
+        if progress is not None:
+            progress.update()
+        if result is None:
+            continue
+        filename, block, n_rows, keys, mistyped, timings = result
+        metrics.record("read", *timings["read"], bytes=timings["bytes"])
+        metrics.record("decode", *timings["decode"], rows=n_rows, bytes=timings["bytes"])
+        metrics.record("format", *timings["format"], rows=n_rows, bytes=len(block))
+        drift.check(filename, keys, n_rows, mistyped)
+        yield filename, block, n_rows
+
+
+def _name_sort_key(name: str) -> tuple[str, str]:
+    """Order snapshots by their timestamp, falling back to the name for unparsable files."""
+    return _parse_datetime_from_filename(Path(name)) or "", name
+
+
+def _snapshot_sort_key(ref: SnapshotRef) -> tuple[str, str]:
+    return _name_sort_key(ref.name)
+
+
+def _parse_columns(value: str) -> list[str]:
+    """argparse type for --columns: a comma separated subset of INGEST_COLUMNS."""
+    columns = [c.strip() for c in value.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in INGEST_COLUMNS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"not in the ingest schema: {', '.join(unknown)}")
+    if not columns:
+        raise argparse.ArgumentTypeError("no columns given")
+    return columns
+
+
+def _default_manifest_path(output_path: Path) -> Path:
+    """Manifest lives next to the output, e.g. 'combined.csv.manifest.json'."""
+    return output_path.with_name(output_path.name + ".manifest.json")
+
+
+def _stat_entry(ref: SnapshotRef) -> dict:
+    """Build the manifest entry for a snapshot file (before ingestion)."""
+    return {
+        "size": ref.size,
+        "mtime_ns": ref.mtime_ns,
+        "file_datetime": _parse_datetime_from_filename(Path(ref.name)),
+    }
+
+
+def _load_manifest(manifest_path: Path, output_path: Path) -> dict | None:
+    """Load a manifest, or None if it is missing or does not match the output file."""
+    if not manifest_path.exists() or not output_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as exc:
+        logger.warning(f"Ignoring unreadable manifest {manifest_path}: {exc}")
+        return None
+    # A crashed run may have written rows after the last manifest save; those are
+    # truncated away on resume, but a shorter file means the output was replaced.
+    if output_path.stat().st_size < manifest.get("data_end", 0):
+        logger.warning(f"{output_path} is shorter than recorded in {manifest_path}, rebuilding")
+        return None
+    return manifest
+
+
+def _save_manifest(manifest_path: Path, manifest: dict) -> None:
+    """Atomically write the manifest."""
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def _plan_ingest(files: list[SnapshotRef], manifest: dict) -> tuple[list[SnapshotRef], list[str], dict[str, dict]]:
+    """Split files into those still to ingest and manifest entries that are stale.
+
+    A file is (re-)ingested if it is not in the manifest or its size/mtime changed.
+    Entries for changed or removed files are returned as stale so their rows can be dropped.
+    """
+    known = manifest["files"]
+    to_ingest = []
+    stale = []
+    stats = {}
+    seen = set()
+    for ref in files:
+        entry = _stat_entry(ref)
+        stats[ref.name] = entry
+        seen.add(ref.name)
+        old = known.get(ref.name)
+        if old is None:
+            to_ingest.append(ref)
+        elif old["size"] != entry["size"] or old["mtime_ns"] != entry["mtime_ns"]:
+            to_ingest.append(ref)
+            stale.append(ref.name)
+    stale.extend(name for name in known if name not in seen)
+    return to_ingest, stale, stats
+
+
+def _rewrite_blocks(output_path: Path, manifest: dict, order: list[str]) -> None:
+    """Rewrite the output with the blocks of the files in `order` and fix up their offsets."""
+    files = manifest["files"]
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(output_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        dst.write(src.readline())  # header
+        for entry in (files[name] for name in order):
+            src.seek(entry["offset"])
+            block = src.read(entry["length"])
+            entry["offset"] = dst.tell()
+            dst.write(block)
+        manifest["data_end"] = dst.tell()
+    os.replace(tmp_path, output_path)
+
+
+def _drop_stale_rows(output_path: Path, manifest: dict, stale: list[str]) -> None:
+    """Rewrite the output without the byte ranges of stale files."""
+    files = manifest["files"]
+    for name in stale:
+        del files[name]
+    _rewrite_blocks(output_path, manifest, sorted(files, key=lambda name: files[name]["offset"]))
+
+
+def _restore_order(output_path: Path, manifest: dict) -> bool:
+    """Put the blocks back in snapshot-timestamp order if appending broke it; returns whether it did.
+
+    Changed snapshots and snapshots that arrive late are appended at the end, which
+    would leave the output out of order for data_transformation's --incremental mode.
+    """
+    files = manifest["files"]
+    by_offset = sorted(files, key=lambda name: files[name]["offset"])
+    by_time = sorted(files, key=_name_sort_key)
+    if by_offset == by_time:
+        return False
+    _rewrite_blocks(output_path, manifest, by_time)
+    return True
+
+
+def _parquet_partition(filename: str) -> str:
+    """Day partition value for a snapshot, taken from its filename."""
+    file_dt = _parse_datetime_from_filename(Path(filename))
+    return file_dt[:10] if file_dt else PARQUET_NULL_PARTITION
+
+
+def _clear_parquet_dataset(output_dir: Path) -> None:
+    """Remove day partitions written by a previous full build."""
+    for part_dir in output_dir.glob(f"{PARQUET_PARTITION_KEY}=*"):
+        if part_dir.is_dir():
+            shutil.rmtree(part_dir)
+
+
+def _write_parquet_batch(output_dir: Path, batch_index: int, tables: list[tuple[str, pa.Table]]) -> None:
+    """Write one part file per day touched by the batch, e.g. 'date=2025-08-01/part-00003.parquet'."""
+    by_day = {}
+    for filename, table in tables:
+        by_day.setdefault(_parquet_partition(filename), []).append(table)
+    for day, day_tables in by_day.items():
+        part_dir = output_dir / f"{PARQUET_PARTITION_KEY}={day}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        table = pa.concat_tables(day_tables).unify_dictionaries()
+        pq.write_table(table, part_dir / f"part-{batch_index:05d}.parquet", compression="zstd")
+
+
+def _write_blocks(outfile, manifest: dict, stats: dict[str, dict], encoded: list[tuple[str, bytes, int]]) -> None:
+    """Write per-file CSV blocks in order and record where each one lands in the output."""
+    offset = manifest["data_end"]
+    for filename, block, n_rows in encoded:
+        entry = stats[filename]
+        entry.update(rows=n_rows, offset=offset, length=len(block))
+        manifest["files"][filename] = entry
+        offset += len(block)
+    # Single write operation
+    outfile.write(b''.join(block for _, block, _ in encoded))
+    outfile.flush()
+    manifest["data_end"] = offset
+
+
+def _build_parquet(input_path: Path, files: list[SnapshotRef], output_dir: Path, columns: list[str],
+                   args: argparse.Namespace, metrics: Metrics) -> None:
+    """Write the snapshots as a typed Parquet dataset partitioned by snapshot day."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    _clear_parquet_dataset(output_dir)
+
+    progress = metrics.progress("ingest", len(files), "files")
+    drift = SchemaDriftReporter(columns)
+
+    executor_cls = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+    with metrics.phase("ingest") as ingest, executor_cls(max_workers=args.max_workers) as executor:
+        for batch_index, batch_files in enumerate(_iter_batches(input_path, files, args.batch_size)):
+            tables = [
+                (filename, pa.ipc.open_stream(block).read_all())
+                for filename, block, _ in _encode_files(executor, batch_files, columns, "parquet",
+                                                        args.max_workers, drift, progress, metrics)
+            ]
+            if tables:
+                with metrics.phase("write") as write:
+                    _write_parquet_batch(output_dir, batch_index, tables)
+                    write.add(rows=sum(t.num_rows for _, t in tables))
+                ingest.add(rows=sum(t.num_rows for _, t in tables))
+    drift.summary()
+    logger.info(f"All data saved to {output_dir}")
+
+
+def _build_csv(input_path: Path, files: list[SnapshotRef], output_path: Path, columns: list[str],
+               args: argparse.Namespace, metrics: Metrics) -> None:
+    """Write the snapshots to one CSV, or append the new and changed ones with --append."""
+    manifest_path = Path(args.manifest) if args.manifest else _default_manifest_path(output_path)
+
+    manifest = _load_manifest(manifest_path, output_path) if args.append else None
+    if manifest is not None and manifest["fieldnames"] != columns:
+        logger.info(f"Columns differ from {manifest_path}, doing a full build")
+        manifest = None
+    if manifest is None:
+        if args.append:
+            logger.info(f"No usable manifest at {manifest_path}, doing a full build")
+        manifest = {"fieldnames": columns, "data_end": 0, "files": {}}
+        files_to_ingest = files
+        stats = {ref.name: _stat_entry(ref) for ref in files}
+        mode = 'wb'
+    else:
+        files_to_ingest, stale, stats = _plan_ingest(files, manifest)
+        logger.info(f"{len(files_to_ingest)} new or changed files, {len(stale)} stale entries in manifest")
+        if stale:
+            _drop_stale_rows(output_path, manifest, stale)
+            logger.info(f"Dropped rows of {len(stale)} changed or removed files from {output_path}")
+        mode = 'r+b'
+
+    progress = metrics.progress("ingest", len(files_to_ingest), "files")
+    drift = SchemaDriftReporter(columns)
+
+    executor_cls = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+    with metrics.phase("ingest") as ingest, open(output_path, mode) as outfile, executor_cls(max_workers=args.max_workers) as executor:
+        if manifest["data_end"] == 0:
+            # The header comes from the declared schema, so later files can never shift columns
+            header = (','.join(columns) + '\n').encode('utf-8')
+            outfile.write(header)
+            manifest["data_end"] = len(header)
+        else:
+            # Discard anything a previous, interrupted run wrote after the last manifest save
+            outfile.seek(manifest["data_end"])
+            outfile.truncate()
+        for batch_files in _iter_batches(input_path, files_to_ingest, args.batch_size):
+            encoded = list(_encode_files(executor, batch_files, columns, "csv", args.max_workers, drift, progress, metrics))
+            if not encoded:
+                continue
+            with metrics.phase("write") as write:
+                _write_blocks(outfile, manifest, stats, encoded)
+                _save_manifest(manifest_path, manifest)
+                write.add(rows=sum(n for _, _, n in encoded), bytes=sum(len(b) for _, b, _ in encoded))
+            ingest.add(rows=sum(n for _, _, n in encoded))
+    if mode == 'r+b':
+        with metrics.phase("reorder"):
+            if _restore_order(output_path, manifest):
+                logger.info(f"Changed or late snapshots were appended out of order, rewrote {output_path} in timestamp order")
+    _save_manifest(manifest_path, manifest)
+    drift.summary()
+    logger.info(f"All data saved to {output_path}")
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
-    args = argparse.ArgumentParser(description="Combine JSON files into a single CSV.")
-    args.add_argument('--input', type=str, default="data/august/raw", help="Directory containing JSON files.")
-    args.add_argument('--output', type=str, default="data/august/combined_output.csv", help="Output CSV file path.")
-    args.add_argument('--max-workers', type=int, default=MAX_WORKERS, help="Maximum number of worker threads.")
-    args.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of files to process in each batch.")
-    args.add_argument('--progress', action='store_true', help="Show progress during processing.")
-    args = args.parse_args()
-
-    data_dir = Path(args.input)
-    files = sorted(data_dir.glob("*.json"))
-    
-    total_files = len(files)
+    parser = argparse.ArgumentParser(description="Combine JSON files into a single CSV.")
+    parser.add_argument('--input', type=str, default="data/august/raw", help="Directory of .json/.json.gz snapshots, or a .zip/.tar(.gz/.zst) archive of them.")
+    parser.add_argument('--output', type=str, default="data/august/combined_output.csv", help="Output CSV file path (a directory for --format parquet).")
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS, help="Maximum number of worker threads or processes.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of files to process in each batch.")
+    parser.add_argument('--executor', choices=["thread", "process"], default="thread",
+                        help="Read files in threads, or parse and format them in worker processes (scales with cores).")
+    parser.add_argument('--format', choices=["csv", "parquet"], default="csv",
+                        help="Write a single CSV, or a typed Parquet dataset partitioned by day into the --output directory.")
+    parser.add_argument('--columns', type=_parse_columns, default=INGEST_COLUMNS,
+                        help="Comma separated subset of the ingest schema to keep, e.g. 'licencePlate,lat,lon,file_datetime'.")
+    parser.add_argument('--progress', action='store_true', help="Log progress every second instead of every 30 seconds.")
+    parser.add_argument('--append', action='store_true',
+                        help="Only ingest snapshots not yet recorded in the manifest and append their rows.")
+    parser.add_argument('--manifest', type=str, default=None,
+                        help="Manifest file path (default: '<output>.manifest.json').")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.format == "parquet" and args.append:
+        parser.error("--append is only supported for --format csv")
+
+    metrics = Metrics.from_args("build_csv", args)
+    if args.progress:
+        metrics.progress_interval_s = 1.0
+    input_path = Path(args.input)
+    try:
+        # Snapshot-timestamp order, so the output is reproducible and already time-ordered
+        with metrics.phase("list"):
+            files = sorted(_list_snapshots(input_path), key=_snapshot_sort_key)
+    except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile) as exc:
+        parser.error(f"cannot read --input: {exc}")
     output_path = Path(args.output)
-    first_batch = True
-    all_fieldnames = set()
 
-    logger.info(f"Found {total_files} JSON files in {data_dir}")
+    logger.info(f"Found {len(files)} JSON files in {input_path}")
 
-    if args.progress:
-        progress = ProgressTracker(total_files) 
-    
-    with open(output_path, 'w', newline='', encoding='utf-8') as outfile:
-        for i in range(0, total_files, BATCH_SIZE):
-            batch_files = files[i:i + BATCH_SIZE]
-            batch_results = []
-            # Read files in parallel
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                future_to_file = {executor.submit(_read_single_file, fp): fp for fp in batch_files}
-                for future in as_completed(future_to_file):
-                    result = future.result()
-                    if result is not None:
-                        batch_results.append(result)
-                    if args.progress:
-                        progress.update()
-            # Process and collect rows
-            if batch_results:
-                batch_rows = []
-                for result in batch_results:
-                    data, filename = result
-                    file_dt = _parse_datetime_from_filename(Path(filename))
-                    for obj in data:
-                        if file_dt:
-                            obj["file_datetime"] = file_dt
-                        all_fieldnames.update(obj.keys())
-                        batch_rows.append(obj)
-                if not batch_rows:
-                    continue
-                fieldnames = sorted(all_fieldnames)
-                # Write header on first batch
-                if first_batch:
-                    outfile.write(','.join(fieldnames) + '\n')
-                    first_batch = False
-                # Build CSV content manually for speed
-                lines = []
-                for row in batch_rows:
-                    lines.append(_build_csv_line(row, fieldnames))
-                # Single write operation
-                outfile.write(''.join(lines))
-    logger.info(f"All data saved to {output_path}")
+    if args.format == "parquet":
+        _build_parquet(input_path, files, output_path, args.columns, args, metrics)
+    else:
+        _build_csv(input_path, files, output_path, args.columns, args, metrics)
+    metrics.close()
  
  
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,86 +1,139 @@
-import pandas as pd
 import numpy as np
+import pandas as pd
+from scipy import sparse
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
 import argparse
 import folium
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from annotation import NOT_ANNOTATED
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+from poi import POI_CONFIG, default_index
 
 
 KMS_PER_RADIAN = 6371.0088
 ROUND_DECIMALS = 10
 EPS_KM = 0.2
 MIN_CLUSTER_SIZE_DEFAULT = 20
+MIN_SAMPLES = 10
+GRAPH_CACHE_DIR = "artifacts/cache"
+SWEEP_OUTPUT = "artifacts/cluster_sweep.csv"
 
-CPH_AIRPORT_COORDS = (55.630397, 12.648908)
-BILLUND_AIRPORT_COORDS = (55.740020, 9.151920)
-AARHUS_AIRPORT_COORDS = (56.303878, 10.619709)
-AARHUS_SEAPLANE_COORDS = (56.150649, 10.253114)
-def main():
-    parser = argparse.ArgumentParser("Detect hotspots in car pickup locations using DBSCAN clustering.")
-    parser.add_argument(
-        "--input",
-        type=str,
-        required=False,
-        default="data/group.csv",
-    )
+# Marker colour per POI category of a cluster centre; clusters away from any POI are green
+POI_COLORS = {"airport": "blue"}
+POI_COLOR_DEFAULT = "purple"
+NO_POI_COLOR = "green"
 
-    args = parser.parse_args()
 
-    df = pd.read_csv(
-        args.input,
-        usecols=["lat", "lon"],
-        dtype={"lat": "float32", "lon": "float32"},
-    )
+def unique_locations(lat, lon, decimals=ROUND_DECIMALS):
+    """Deduplicate rounded coordinates.
 
-    df = df.dropna(subset=["lat", "lon"])
-    df = df[
-        (df["lat"].between(-90, 90)) &
-        (df["lon"].between(-180, 180))
-    ].reset_index(drop=True)
+    Returns the unique lat/lon pairs, the index of each row's pair and the number
+    of rows per pair. Pairs are compared by value, so distinct locations never collide.
+    """
+    # + 0.0 turns -0.0 into 0.0, which would otherwise be a separate pair
+    lat_r = np.round(lat, decimals) + 0.0
+    lon_r = np.round(lon, decimals) + 0.0
+    order = np.lexsort((lon_r, lat_r))
+    lat_s, lon_s = lat_r[order], lon_r[order]
+    new_pair = np.empty(len(order), dtype=bool)
+    new_pair[:1] = True
+    new_pair[1:] = (lat_s[1:] != lat_s[:-1]) | (lon_s[1:] != lon_s[:-1])
+    starts = np.flatnonzero(new_pair)
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(new_pair) - 1
+    counts = np.diff(np.append(starts, len(order)))
+    return lat_s[starts], lon_s[starts], inverse, counts
 
-    lat = df["lat"].to_numpy(copy=False)
-    lon = df["lon"].to_numpy(copy=False)
 
-    lat_r = np.round(lat, ROUND_DECIMALS)
-    lon_r = np.round(lon, ROUND_DECIMALS)
+def _graph_cache_path(input_path, max_eps_km, cache_dir):
+    """Cache file of the neighbor graph, keyed by the input file, the rounding and the radius."""
+    stat = os.stat(input_path)
+    key = json.dumps([os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns, ROUND_DECIMALS, max_eps_km])
+    return Path(cache_dir) / f"neighbors_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz"
 
-    scale = 10 ** ROUND_DECIMALS
 
-    lat_i = np.asarray((lat_r + 90.0) * scale, dtype=np.int64)
-    lon_i = np.asarray((lon_r + 180.0) * scale, dtype=np.int64)
-    keys = lat_i * 1_000_000_000 + lon_i
+def neighbor_graph(coords, max_eps_km, cache_path=None):
+    """Sparse haversine radius-neighbors graph of `coords` (radians) up to `max_eps_km`.
 
-    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    Distances are in radians. The graph is loaded from `cache_path` if it exists and
+    saved there otherwise.
+    """
+    if cache_path is not None and cache_path.exists():
+        print(f"Loaded neighbor graph from {cache_path}")
+        return sparse.load_npz(cache_path)
+    nn = NearestNeighbors(radius=max_eps_km / KMS_PER_RADIAN, metric="haversine", algorithm="ball_tree", n_jobs=-1)
+    graph = nn.fit(coords).radius_neighbors_graph(mode="distance", sort_results=True)
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(cache_path, graph)
+        print(f"Saved neighbor graph to {cache_path}")
+    return graph
 
-    first_idx = np.zeros(unique_keys.shape[0], dtype=np.int64)
-    first_pos = np.full(unique_keys.shape[0], -1, dtype=np.int64)
-    for i, u in enumerate(inverse):
-        if first_pos[u] == -1:
-            first_pos[u] = i
-    first_idx = first_pos
 
-    lat_u = lat_r[first_idx]
-    lon_u = lon_r[first_idx]
+def sweep(graph, counts, eps_values_km, min_samples_values):
+    """Run weighted DBSCAN on the precomputed `graph` for every (eps, min_samples) pair.
 
-    coords_u = np.radians(np.column_stack([lat_u, lon_u]).astype(np.float64, copy=False))
+    Returns one row per setting with the number of clusters, the fraction of pickups
+    labelled noise and the cluster sizes in pickups.
+    """
+    total = counts.sum()
+    results = []
+    for eps_km in eps_values_km:
+        eps = eps_km / KMS_PER_RADIAN
+        # Drop the edges beyond eps once, so every min_samples runs on the smaller graph
+        keep = graph.data <= eps
+        indptr = np.concatenate([[0], np.cumsum(keep)])[graph.indptr]
+        graph_eps = sparse.csr_matrix((graph.data[keep], graph.indices[keep], indptr), shape=graph.shape)
+        for min_samples in min_samples_values:
+            labels = DBSCAN(
+                eps=eps,
+                min_samples=min_samples,
+                metric="precomputed",
+                n_jobs=-1,
+            ).fit(graph_eps, sample_weight=counts).labels_
+            clustered = labels >= 0
+            sizes = np.bincount(labels[clustered], weights=counts[clustered]) if clustered.any() else np.zeros(0)
+            results.append({
+                "eps_km": eps_km,
+                "min_samples": min_samples,
+                "clusters": len(sizes),
+                f"clusters_ge_{MIN_CLUSTER_SIZE_DEFAULT}": int((sizes >= MIN_CLUSTER_SIZE_DEFAULT).sum()),
+                "noise_fraction": float(counts[~clustered].sum() / total) if total else 0.0,
+                "largest": int(sizes.max()) if len(sizes) else 0,
+                "median_size": float(np.median(sizes)) if len(sizes) else 0.0,
+            })
+    return pd.DataFrame(results)
+
+
+def _parse_list(value, cast):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def cluster_locations(coords_u, counts):
+    """DBSCAN labels of the unique locations (in radians), weighted by their pickup counts."""
     eps = EPS_KM / KMS_PER_RADIAN
+    # Each unique location weighs as many pickups as it has, so min_samples counts
+    # pickups rather than distinct spots while DBSCAN runs on the unique set only
     db = DBSCAN(
         eps=eps,
-        min_samples=10,
+        min_samples=MIN_SAMPLES,
         metric="haversine",
         algorithm="ball_tree",
         leaf_size=40,
         n_jobs=-1,
-    ).fit(coords_u)
-
-    labels_u = db.labels_
+    ).fit(coords_u, sample_weight=counts)
+    return db.labels_
 
-    labels = labels_u[inverse]
-    df["cluster"] = labels
-
-    n_clusters = int(len(set(labels)) - (1 if -1 in labels else 0))
-    print("Rows:", len(df))
-    print("Clusters found:", n_clusters)
 
+def draw_map(df, pois_path):
+    """Map of the clusters with at least MIN_CLUSTER_SIZE_DEFAULT pickups, coloured by their POI."""
     center_lat = float(df["lat"].mean())
     center_lon = float(df["lon"].mean())
     m = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles="OpenStreetMap")
@@ -96,36 +149,109 @@ def main():
     centers = centers[centers["count"] >= MIN_CLUSTER_SIZE_DEFAULT] 
     print(f"Clusters plotted (size >= {MIN_CLUSTER_SIZE_DEFAULT}):", len(centers))
 
+    # Tag all cluster centres with their nearest POI in one query
+    centers["poi"], centers["poi_category"] = default_index(pois_path).tag(centers["lat"], centers["lon"])
+
     for _, row in centers.iterrows():
-        cluster_id = int(row["cluster"])
         count = int(row["count"])
         radius = float(min(40, 5 + np.log1p(count) * 5))
-        
-        # Color blue if close to any airport, else red
-        color  = "blue" if any(
-            np.sqrt(
-                (row["lat"] - airport[0])**2 +
-                (row["lon"] - airport[1])**2
-            ) < margin
-            for airport, margin in [
-                (CPH_AIRPORT_COORDS,0.005),
-                (BILLUND_AIRPORT_COORDS,0.05),
-                (AARHUS_AIRPORT_COORDS,0.05),
-                (AARHUS_SEAPLANE_COORDS,0.02),
-            ]
-        ) else "green"
-
-        
+
+        if row["poi"] == NOT_ANNOTATED:
+            color, tooltip = NO_POI_COLOR, f"{count} pickups"
+        else:
+            color = POI_COLORS.get(row["poi_category"], POI_COLOR_DEFAULT)
+            tooltip = f"{row['poi']}: {count} pickups"
+
         folium.CircleMarker(
             location=[float(row["lat"]), float(row["lon"])],
             radius=radius,
             color=color,
             fill=True,
             fill_opacity=0.6,
+            tooltip=tooltip,
         ).add_to(m)
 
     m.save("artifacts/cluster_map.html")
     print(f"Saved interactive map to artifacts/cluster_map.html")
 
+
+def main():
+    parser = argparse.ArgumentParser("Detect hotspots in car pickup locations using DBSCAN clustering.")
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=False,
+        default="data/data_transformed.csv",
+    )
+    parser.add_argument(
+        "--sweep-eps",
+        type=str,
+        help="Comma-separated eps values in km, e.g. 0.1,0.2,0.3. Runs a parameter sweep instead of drawing the map.",
+    )
+    parser.add_argument(
+        "--sweep-min-samples",
+        type=str,
+        default=str(MIN_SAMPLES),
+        help="Comma-separated min_samples values (in pickups) for --sweep-eps.",
+    )
+    parser.add_argument("--cache-dir", type=str, default=GRAPH_CACHE_DIR, help="Where the sweep caches neighbor graphs.")
+    parser.add_argument("--pois", type=str, default=str(POI_CONFIG), help="JSON file of points of interest to tag clusters with.")
+    parser.add_argument("--sweep-output", type=str, default=SWEEP_OUTPUT, help="CSV file for the sweep results.")
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    metrics = Metrics.from_args("cluster", args)
+    with metrics.phase("load") as phase:
+        df = load_transformed(args.input, ["lat", "lon"])
+
+        df = df.dropna(subset=["lat", "lon"])
+        df = df[
+            (df["lat"].between(-90, 90)) &
+            (df["lon"].between(-180, 180))
+        ].reset_index(drop=True)
+        phase.add(rows=len(df))
+
+    lat = df["lat"].to_numpy(copy=False)
+    lon = df["lon"].to_numpy(copy=False)
+
+    with metrics.phase("dedup") as phase:
+        lat_u, lon_u, inverse, counts = unique_locations(lat, lon)
+        phase.add(rows=len(lat))
+
+    coords_u = np.radians(np.column_stack([lat_u, lon_u]).astype(np.float64, copy=False))
+
+    if args.sweep_eps:
+        eps_values = _parse_list(args.sweep_eps, float)
+        min_samples_values = _parse_list(args.sweep_min_samples, int)
+        # One graph at the largest eps serves every smaller eps of the sweep
+        max_eps_km = max(eps_values)
+        with metrics.phase("neighbor_graph"):
+            graph = neighbor_graph(coords_u, max_eps_km, _graph_cache_path(args.input, max_eps_km, args.cache_dir))
+        with metrics.phase("sweep"):
+            results = sweep(graph, counts, eps_values, min_samples_values)
+        print(results.to_string(index=False))
+        Path(args.sweep_output).parent.mkdir(parents=True, exist_ok=True)
+        results.to_csv(args.sweep_output, index=False)
+        print(f"Saved sweep results to {args.sweep_output}")
+        metrics.close()
+        return
+
+    with metrics.phase("cluster") as phase:
+        labels_u = cluster_locations(coords_u, counts)
+        phase.add(rows=len(coords_u))
+
+    labels = labels_u[inverse]
+    df["cluster"] = labels
+
+    n_clusters = int(len(set(labels)) - (1 if -1 in labels else 0))
+    print("Rows:", len(df))
+    print("Clusters found:", n_clusters)
+
+    with metrics.phase("map"):
+        draw_map(df, args.pois)
+    metrics.close()
+
 if __name__ == "__main__":
     main()
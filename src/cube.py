@@ -0,0 +1,128 @@
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ["date", "hour", "area_name", "car_type"]
+MEASURES = ["count", "sum", "sumsq"]
+CUBE_FILE = "cube.parquet"
+PLATES_FILE = "plates.parquet"
+CHUNK_SIZE = 1_000_000
+
+# Dimensions derived from the stored ones when a rollup asks for them
+DERIVED = {
+    "day_of_week": lambda cells: cells["date"].dt.day_name(),
+    "month": lambda cells: cells["date"].dt.strftime("%Y-%m"),
+}
+
+
+def _aggregate(segments):
+    """Partial cube and plate counts of one chunk of parking segments."""
+    parking_time = segments["parking_time"].astype(np.float64)
+    keys = pd.DataFrame({
+        "date": segments["start_time"].dt.normalize(),
+        "hour": segments["start_time"].dt.hour.astype(np.int8),
+        "area_name": segments["area_name"],
+        "car_type": segments["car_type"],
+    })
+    cells = keys.assign(count=1, sum=parking_time, sumsq=parking_time ** 2)
+    cells = cells.groupby(DIMENSIONS, observed=True, dropna=False)[MEASURES].sum()
+    plates = segments["licencePlate"].value_counts()
+    return cells, plates[plates > 0]
+
+
+class Cube:
+    """Parking segments rolled up to date x hour x area_name x car_type with count, sum and sum of squares
+    of parking_time, plus the number of segments per licence plate."""
+
+    def __init__(self, cells, plates):
+        self.cells = cells
+        self.plates = plates
+
+    @classmethod
+    def build(cls, path, chunksize=CHUNK_SIZE):
+        """Build the cube from a transformed CSV in one chunked pass."""
+        columns = ["licencePlate", "start_time", "parking_time", "area_name", "car_type"]
+        parts, plate_parts = [], []
+        for chunk in load_transformed(path, columns, chunksize=chunksize):
+            cells, plates = _aggregate(chunk)
+            parts.append(cells)
+            plate_parts.append(plates)
+        if not parts:
+            raise ValueError(f"{path} has no parking segments")
+        cells = pd.concat(parts).groupby(level=DIMENSIONS, observed=True, dropna=False).sum().reset_index()
+        cells["count"] = cells["count"].astype(np.int64)
+        plates = pd.concat(plate_parts).groupby(level=0, observed=True).sum().sort_values(ascending=False)
+        return cls(cells, plates.rename("count"))
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        plates = pd.read_parquet(path / PLATES_FILE).set_index("licencePlate")["count"]
+        return cls(pd.read_parquet(path / CUBE_FILE), plates)
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.cells.to_parquet(path / CUBE_FILE, index=False)
+        self.plates.rename_axis("licencePlate").reset_index().to_parquet(path / PLATES_FILE, index=False)
+
+    def rollup(self, by, where=None):
+        """Count, sum, mean and standard deviation of parking_time per `by`.
+
+        `by` is a dimension or a list of them (DIMENSIONS or DERIVED); `where` maps
+        dimensions to a value or a list of allowed values.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        cells = self.cells
+        for dim in set(by) | set(where or {}):
+            if dim in DERIVED and dim not in cells:
+                cells = cells.assign(**{dim: DERIVED[dim](cells)})
+            elif dim not in cells:
+                raise KeyError(f"Unknown dimension {dim!r}, use one of {DIMENSIONS + list(DERIVED)}")
+        for dim, allowed in (where or {}).items():
+            allowed = allowed if isinstance(allowed, (list, tuple, set)) else [allowed]
+            cells = cells[cells[dim].isin(allowed)]
+        out = cells.groupby(by, observed=True)[MEASURES].sum()
+        out["mean"] = out["sum"] / out["count"]
+        # Sample standard deviation from the running sums, like Series.std()
+        var = (out["sumsq"] - out["sum"] ** 2 / out["count"]) / (out["count"] - 1)
+        out["std"] = np.sqrt(var.clip(lower=0).where(out["count"] > 1))
+        return out.drop(columns="sumsq")
+
+    def pivot(self, index, columns, measure="count"):
+        """Two-dimensional rollup as a table, e.g. day of week x hour counts."""
+        return self.rollup([index, columns])[measure].unstack(columns, fill_value=0)
+
+    def top_plates(self, n=10):
+        return self.plates.head(n)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the aggregate cube of the parking segments for the notebooks.")
+    parser.add_argument('--input', type=str, required=True, help="Transformed CSV from data_transformation.py.")
+    parser.add_argument('--output', type=str, required=True, help="Output directory of the cube.")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help="Rows read per chunk.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = Metrics.from_args("cube", args)
+    with metrics.phase("build") as phase:
+        cube = Cube.build(args.input, args.chunksize)
+        phase.add(rows=int(cube.cells["count"].sum()))
+    with metrics.phase("save"):
+        cube.save(args.output)
+    metrics.close()
+    logger.info(f"Saved cube with {len(cube.cells)} cells of {int(cube.cells['count'].sum())} segments to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
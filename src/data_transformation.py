@@ -2,34 +2,138 @@ import argparse
 import pandas as pd
 import numpy as np
 import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from annotation import area_names, car_models, car_types
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_combined
+from poi import POI_CONFIG, poi_tags
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    parser = argparse.ArgumentParser(description="Data Transformation Script")
-    parser.add_argument("--input", type=str, required=True, help="Path to the input data file (CSV)")
-    parser.add_argument("--output", type=str, required=True, help="Path to the output data file")
-    args = parser.parse_args()
+# Columns of the combined snapshot table used by the segmentation
+INPUT_COLUMNS = ["licencePlate", "file_datetime", "lat", "lon", "vehicleTypeId", "zipCode"]
+
+# A car has moved when lat or lon changes by more than this between consecutive snapshots
+MOVE_THRESHOLD = 1e-3
+
+# Rows per chunk when partitioning the input into shards
+CHUNK_SIZE = 1_000_000
+
+# Shard files hold INPUT_COLUMNS already normalized by _prepare_chunk
+SHARD_SCHEMA = pa.schema([
+    ("licencePlate", pa.string()),
+    ("file_datetime", pa.timestamp("ns")),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("vehicleTypeId", pa.string()),
+    ("zipCode", pa.int64()),
+])
+
+
+def read_snapshots(path, days=None):
+    """Read the combined snapshots from a CSV file or a day-partitioned Parquet dataset.
+
+    For Parquet only INPUT_COLUMNS and, if given, the requested days ('YYYY-MM-DD') are read.
+    """
+    if Path(path).is_dir() or str(path).endswith(".parquet"):
+        filters = [("date", "in", list(days))] if days else None
+        return pd.read_parquet(path, columns=INPUT_COLUMNS, filters=filters)
+    return load_combined(path, INPUT_COLUMNS)
+
+
+def iter_snapshot_chunks(path, days=None, chunksize=CHUNK_SIZE, since=None):
+    """Yield the INPUT_COLUMNS of the combined snapshots in chunks of about `chunksize` rows.
+
+    With `since` (a Timestamp) only rows with a later file_datetime are returned; for a
+    Parquet dataset older day partitions are not read at all.
+    """
+    if Path(path).is_dir() or str(path).endswith(".parquet"):
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        row_filter = ds.field("date").isin(list(days)) if days else None
+        if since is not None:
+            since_filter = (ds.field("date") >= since.strftime("%Y-%m-%d")) & (ds.field("file_datetime") > since.to_pydatetime())
+            row_filter = since_filter if row_filter is None else row_filter & since_filter
+        for batch in dataset.to_batches(columns=INPUT_COLUMNS, filter=row_filter, batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    for chunk in load_combined(path, INPUT_COLUMNS, chunksize=chunksize):
+        if since is not None:
+            chunk = chunk[chunk["file_datetime"] > since]
+        yield chunk
+
+
+def normalize_plates(plates):
+    """Lower-case licence plates and remove spaces, e.g. 'CL 91 936' -> 'cl91936'.
+
+    Categoricals are normalized once per category and stay categorical, with the
+    categories sorted so that sorting by plate gives the same order as for strings.
+    """
+    if isinstance(plates.dtype, pd.CategoricalDtype):
+        codes = plates.cat.codes.to_numpy()
+        labels = normalize_plates(pd.Series(plates.cat.categories, dtype=object)).to_numpy(dtype=object)
+        if (codes < 0).any():
+            # Missing plates become "nan", like astype(str) does for the plain path
+            labels = np.append(labels, "nan")
+            codes = np.where(codes < 0, len(labels) - 1, codes)
+        categories, inverse = np.unique(labels.astype(str), return_inverse=True)
+        return pd.Series(pd.Categorical.from_codes(inverse[codes], categories), index=plates.index, name=plates.name)
+    return plates.astype(str).str.lower().str.replace(" ", "", regex=False).str.strip()
+
+
+def extract_zip_codes(zip_codes):
+    """Extract the 4-digit zip code as int, -1 if there is none; once per category for categoricals."""
+    if isinstance(zip_codes.dtype, pd.CategoricalDtype):
+        codes = zip_codes.cat.codes.to_numpy()
+        values = extract_zip_codes(pd.Series(zip_codes.cat.categories, dtype=object)).to_numpy()
+        return pd.Series(np.where(codes >= 0, values[codes], -1), index=zip_codes.index, name=zip_codes.name)
+    return zip_codes.astype(str).str.extract(r'(\d{4})')[0].astype(float).fillna(-1).astype(int)
+
+
+def annotate_segments(grouped, pois=POI_CONFIG):
+    """Add car type and model, area, POI and start/end day and hour to parking segments and drop zero-length ones.
+
+    POIs are read from the JSON file `pois`.
+    """
+    grouped['car_type'] = car_types(grouped['vehicleTypeId'])
+    grouped['car_model'] = car_models(grouped['vehicleTypeId'])
+    grouped['area_name'] = area_names(grouped['zipCode'])
+    grouped['poi'], grouped['poi_category'] = poi_tags(grouped['lat'], grouped['lon'], pois)
+
+    grouped["day_of_week_start"] = pd.to_datetime(grouped["start_time"]).dt.day_name()
+    grouped["hour_of_day_start"] = pd.to_datetime(grouped["start_time"]).dt.hour
+
+    grouped["day_of_week_end"] = pd.to_datetime(grouped["end_time"]).dt.day_name()
+    grouped["hour_of_day_end"] = pd.to_datetime(grouped["end_time"]).dt.hour
+
+    return grouped[grouped["parking_time"] > 0].reset_index(drop=True)
 
-    df = pd.read_csv(args.input)
 
-    logger.info(f"Loaded data with {len(df)} rows from {args.input}")
+def segment_snapshots(df, thr=MOVE_THRESHOLD, with_end_position=False):
+    """Group consecutive snapshots of each plate into parking segments.
 
+    A new segment starts when the plate changes or lat/lon moves more than `thr`
+    from the previous snapshot. Only the rows of the plates in `df` are needed,
+    so plates can be segmented independently. Rows with 'seg_start', 'seg_lat' and
+    'seg_lon' set are open segments seeded by --incremental. With `with_end_position`
+    the position of each segment's last snapshot is added as 'end_lat'/'end_lon'.
+    """
     # Strip whitespace from column names
     df.rename(columns=lambda x: x.strip(), inplace=True)
 
     logger.info("Stripped whitespace from column names")
 
     # Ensure 'licencePlate' column is string type and normalize its values
-    df["licencePlate"] = (
-        df["licencePlate"]
-        .astype(str)
-        .str.lower()
-        .str.replace(" ", "", regex=False)
-        .str.strip()
-    )
+    df["licencePlate"] = normalize_plates(df["licencePlate"])
     logger.info("Normalized 'licencePlate' values")
 
     # Convert 'file_datetime' to datetime and sort the DataFrame
@@ -38,9 +142,7 @@ def main():
     logger.info("Converted 'file_datetime' to datetime and sorted the DataFrame")
 
     # Extract numeric part of 'zipCode', convert to float, handle missing values, and convert to int
-    df["zipCode"] = (df["zipCode"].astype(str).str.extract(r'(\d{4})').astype(float).fillna(-1).astype(int))
-
-    thr = 1e-3
+    df["zipCode"] = extract_zip_codes(df["zipCode"])
 
     lat  = df['lat'].to_numpy()
     lon  = df['lon'].to_numpy()
@@ -63,130 +165,260 @@ def main():
     end_idx   = np.r_[b_idx[1:] - 1, len(df) - 1]
     start_idx = b_idx[:len(end_idx)]
 
+    start_time = df.loc[start_idx, "file_datetime"]
+    start_lat = df.loc[start_idx, "lat"]
+    start_lon = df.loc[start_idx, "lon"]
+    if "seg_start" in df.columns:
+        # Rows seeded from a previous incremental run carry the start of their open segment
+        seeded = df.loc[start_idx, "seg_start"].notna()
+        start_time = start_time.mask(seeded, df.loc[start_idx, "seg_start"])
+        start_lat = start_lat.mask(seeded, df.loc[start_idx, "seg_lat"])
+        start_lon = start_lon.mask(seeded, df.loc[start_idx, "seg_lon"])
+
     # Build output
     grouped = pd.DataFrame({
         "licencePlate": df.loc[start_idx, "licencePlate"].to_numpy(),
-        "start_time":   df.loc[start_idx, "file_datetime"].to_numpy(),
+        "start_time":   start_time.to_numpy(),
         "end_time":     df.loc[end_idx,   "file_datetime"].to_numpy(),
-        "lat":    df.loc[start_idx, "lat"].to_numpy(),
-        "lon":    df.loc[start_idx, "lon"].to_numpy(),
+        "lat":    start_lat.to_numpy(),
+        "lon":    start_lon.to_numpy(),
         "parking_time": np.round(
             (df.loc[end_idx, "file_datetime"].to_numpy() -
-             df.loc[start_idx, "file_datetime"].to_numpy()) /
+             start_time.to_numpy()) /
              np.timedelta64(1, "m")
         ).astype(int),
         "vehicleTypeId": df.loc[start_idx, "vehicleTypeId"].astype(str).to_numpy(),
         "zipCode": df.loc[start_idx, "zipCode"].to_numpy()
     })
+    if with_end_position:
+        grouped["end_lat"] = df.loc[end_idx, "lat"].to_numpy()
+        grouped["end_lon"] = df.loc[end_idx, "lon"].to_numpy()
 
     logger.info("Built grouped DataFrame")
 
-    grouped['car_type'] = grouped['vehicleTypeId'].apply(id_to_car_type)
+    return grouped
 
-    logger.info("Mapped vehicleTypeId to car_model and car_type")
 
-    grouped['area_name'] = grouped['zipCode'].apply(postcode_mapping)
+def _prepare_chunk(chunk):
+    """Apply the per-row normalization of segment_snapshots to a chunk, so shards store final values."""
+    chunk = chunk.rename(columns=lambda x: x.strip())[INPUT_COLUMNS]
+    return chunk.assign(
+        licencePlate=normalize_plates(chunk["licencePlate"]).astype(str),
+        file_datetime=pd.to_datetime(chunk["file_datetime"], errors="coerce"),
+        lat=chunk["lat"].astype(float),
+        lon=chunk["lon"].astype(float),
+        vehicleTypeId=chunk["vehicleTypeId"].astype(str),
+        zipCode=extract_zip_codes(chunk["zipCode"]),
+    )
 
 
-    logger.info("Mapped zipCode to area codes")
-    grouped["day_of_week_start"] = pd.to_datetime(grouped["start_time"]).dt.day_name()
-    grouped["hour_of_day_start"] = pd.to_datetime(grouped["start_time"]).dt.hour
+def partition_into_shards(path, shard_dir, n_shards, days=None, chunksize=CHUNK_SIZE):
+    """Hash-partition the snapshots by normalized plate into `n_shards` Parquet files.
+
+    Every plate ends up in exactly one shard, so shards can be segmented independently.
+    Returns the paths of the non-empty shards.
+    """
+    writers = {}
+    rows = 0
+    try:
+        for chunk in iter_snapshot_chunks(path, days, chunksize):
+            chunk = _prepare_chunk(chunk)
+            rows += len(chunk)
+            shard_ids = pd.util.hash_array(chunk["licencePlate"].to_numpy(dtype=object)) % n_shards
+            for shard_id, part in chunk.groupby(shard_ids, sort=False):
+                writer = writers.get(shard_id)
+                if writer is None:
+                    shard_path = Path(shard_dir) / f"shard-{shard_id:04d}.parquet"
+                    writer = writers[shard_id] = pq.ParquetWriter(shard_path, SHARD_SCHEMA)
+                writer.write_table(pa.Table.from_pandas(part, schema=SHARD_SCHEMA, preserve_index=False))
+            logger.info(f"Partitioned {rows} rows into {len(writers)} shards")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return sorted(Path(shard_dir) / f"shard-{shard_id:04d}.parquet" for shard_id in writers)
+
+
+def _segment_shard(shard_path, pois=POI_CONFIG):
+    """Segment and annotate one shard in a worker process; writes '<shard>.csv' and returns its path."""
+    grouped = annotate_segments(segment_snapshots(pd.read_parquet(shard_path)), pois)
+    out_path = shard_path.with_suffix(".csv")
+    grouped.to_csv(out_path, index=False)
+    return out_path
+
+
+def run_sharded(args, metrics):
+    """Out-of-core variant of main(): partition by plate, segment shards in parallel, concatenate."""
+    output_path = Path(args.output)
+    shard_root = args.shard_dir or output_path.resolve().parent
+    with tempfile.TemporaryDirectory(prefix="shards-", dir=shard_root) as shard_dir:
+        with metrics.phase("partition"):
+            shard_paths = partition_into_shards(args.input, shard_dir, args.shards, args.days, args.chunksize)
+        with metrics.phase("segment"), ProcessPoolExecutor(max_workers=args.max_workers) as executor, \
+                open(output_path, 'wb') as outfile:
+            # map() yields in shard order, so the output is deterministic
+            for i, csv_path in enumerate(executor.map(_segment_shard, shard_paths, repeat(args.pois))):
+                with open(csv_path, 'rb') as f:
+                    header = f.readline()
+                    if i == 0:
+                        outfile.write(header)
+                    shutil.copyfileobj(f, outfile)
+                os.remove(csv_path)
+                logger.info(f"Segmented shard {i + 1}/{len(shard_paths)}")
+    logger.info(f"Saved transformed data to {args.output}")
 
-    grouped["day_of_week_end"] = pd.to_datetime(grouped["end_time"]).dt.day_name()
-    grouped["hour_of_day_end"] = pd.to_datetime(grouped["end_time"]).dt.hour
 
+# Columns of the open segments carried between --incremental runs
+STATE_COLUMNS = ["licencePlate", "start_time", "lat", "lon", "vehicleTypeId", "zipCode", "end_time", "end_lat", "end_lon"]
 
-    grouped = grouped[grouped["parking_time"] > 0].reset_index(drop=True)
 
-    logger.info("Extracted day_of_week and hour_of_day from start_time")
+def _default_state_path(output_path):
+    return output_path.with_name(output_path.name + ".state.parquet")
 
-    grouped.to_csv(args.output, index=False)
 
-    logger.info(f"Saved transformed data to {args.output}")
+def load_state(state_path):
+    """Load open segments and metadata (high-water mark, output size) saved by save_state."""
+    table = pq.read_table(state_path)
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items() if not k.startswith(b"pandas")}
+    return table.to_pandas()[STATE_COLUMNS], metadata
+
+
+def save_state(state_path, state, high_water_mark, output_size):
+    """Atomically save the open segments with the high-water mark and the expected output size."""
+    table = pa.Table.from_pandas(state[STATE_COLUMNS], preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"high_water_mark": high_water_mark.isoformat().encode(),
+        b"output_size": str(output_size).encode(),
+    })
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, state_path)
+
+
+def _seed_rows(state):
+    """Turn saved open segments into one snapshot row per plate for segment_snapshots.
+
+    The row sits at the segment's last sighting, so the next snapshot is compared with
+    that position, and carries the segment start in the seg_* columns.
+    """
+    return pd.DataFrame({
+        "licencePlate": state["licencePlate"],
+        "file_datetime": state["end_time"],
+        "lat": state["end_lat"],
+        "lon": state["end_lon"],
+        "vehicleTypeId": state["vehicleTypeId"],
+        "zipCode": state["zipCode"],
+        "seg_start": state["start_time"],
+        "seg_lat": state["lat"],
+        "seg_lon": state["lon"],
+    })
+
+
+def run_incremental(args, metrics):
+    """Segment only snapshots after the saved high-water mark and append newly closed segments.
+
+    The last segment of every plate may still grow, so it is kept in the state file
+    instead of the output and seeds boundary detection on the next run.
+    """
+    output_path = Path(args.output)
+    state_path = Path(args.state) if args.state else _default_state_path(output_path)
+
+    since = None
+    state = pd.DataFrame(columns=STATE_COLUMNS)
+    resuming = state_path.exists() and output_path.exists()
+    if resuming:
+        state, metadata = load_state(state_path)
+        since = pd.Timestamp(metadata["high_water_mark"])
+        output_size = int(metadata["output_size"])
+        if output_path.stat().st_size < output_size:
+            raise SystemExit(f"{output_path} is shorter than recorded in {state_path}; remove the state file to rebuild")
+        # Drop anything an interrupted run appended after the state was last saved
+        with open(output_path, 'r+b') as f:
+            f.truncate(output_size)
+        logger.info(f"Loaded {len(state)} open segments, reading snapshots after {since}")
+    else:
+        logger.info(f"No state at {state_path}, processing all snapshots and rewriting {output_path}")
+
+    with metrics.phase("load") as load:
+        chunks = list(iter_snapshot_chunks(args.input, args.days, args.chunksize, since=since))
+        new_rows = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=INPUT_COLUMNS)
+        new_rows.rename(columns=lambda x: x.strip(), inplace=True)
+        load.add(rows=len(new_rows))
+    logger.info(f"Loaded {len(new_rows)} new rows from {args.input}")
+    if new_rows.empty:
+        logger.info("Nothing to do")
+        return
+    high_water_mark = pd.to_datetime(new_rows["file_datetime"], errors="coerce").max()
+
+    with metrics.phase("segment") as segment:
+        df = pd.concat([_seed_rows(state), new_rows[INPUT_COLUMNS]], ignore_index=True)
+        grouped = segment_snapshots(df, with_end_position=True)
+        segment.add(rows=len(df))
+
+    # grouped is sorted by plate and start, so each plate's last segment is the open one
+    is_open = (grouped["licencePlate"] != grouped["licencePlate"].shift(-1)).to_numpy()
+    with metrics.phase("annotate") as annotate:
+        closed = annotate_segments(grouped[~is_open].drop(columns=["end_lat", "end_lon"]).reset_index(drop=True), args.pois)
+        annotate.add(rows=len(closed))
+
+    with metrics.phase("write") as write:
+        # Without a state every segment is rebuilt, so the old output must not be kept
+        header = not resuming or output_path.stat().st_size == 0
+        closed.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+        save_state(state_path, grouped[is_open], high_water_mark, output_path.stat().st_size)
+        write.add(rows=len(closed))
+    logger.info(f"Appended {len(closed)} closed segments to {args.output}, {int(is_open.sum())} segments still open")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Data Transformation Script")
+    parser.add_argument("--input", type=str, required=True, help="Path to the input data file (CSV) or Parquet dataset directory")
+    parser.add_argument("--output", type=str, required=True, help="Path to the output data file")
+    parser.add_argument("--days", type=str, nargs="+", default=None, help="Only read these days (YYYY-MM-DD) of a Parquet dataset")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Hash-partition by licence plate into this many shards and segment them in parallel, "
+                             "bounding memory by shard size (output is then ordered by shard, not by plate)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="Rows per chunk when partitioning into shards")
+    parser.add_argument("--max-workers", type=int, default=None, help="Worker processes for segmenting shards")
+    parser.add_argument("--shard-dir", type=str, default=None, help="Directory for temporary shard files (default: next to --output)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process snapshots after the last run's high-water mark and append closed segments; "
+                             "open segments are kept in the state file")
+    parser.add_argument("--state", type=str, default=None, help="State file for --incremental (default: '<output>.state.parquet')")
+    parser.add_argument("--pois", type=str, default=str(POI_CONFIG), help="JSON file of points of interest to tag segments with.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.incremental and args.shards > 0:
+        parser.error("--incremental cannot be combined with --shards")
+
+    metrics = Metrics.from_args("data_transformation", args)
+    if args.incremental:
+        run_incremental(args, metrics)
+    elif args.shards > 0:
+        run_sharded(args, metrics)
+    else:
+        with metrics.phase("load") as load:
+            df = read_snapshots(args.input, args.days)
+            load.add(rows=len(df))
+
+        logger.info(f"Loaded data with {len(df)} rows from {args.input}")
 
+        with metrics.phase("segment") as segment:
+            grouped = segment_snapshots(df)
+            segment.add(rows=len(df))
 
+        with metrics.phase("annotate") as annotate:
+            grouped = annotate_segments(grouped, args.pois)
+            annotate.add(rows=len(grouped))
 
-def id_to_car_type(vehicle_type_id):
-    car_types = {
-        "1": {"model":"Renault Zoe","type":"car"},
-        "2": {"model":"Renault Zoe","type":"car"},
-        "6": {"model":"unknown","type":"van"},
-        "9":  {"model":"Renault Zoe","type":"car"},
-        "10": {"model":"Renault Zoe","type":"car"},
-        "14": {"model":"Renault Zoe","type":"car"},
-        "25": {"model":"unknown","type":"van"},
-        "26": {"model":"Renault Zoe","type":"car"},
-        "31": {"model":"unknown","type":"van"},
-        "32": {"model":"SAIC Motor MAXUS E-Deliver 3","type":"van"},
-        "34": {"model":"Renault Zoe","type":"car"},
-        "35": {"model":"Renault Zoe","type":"car"},
-        "57": {"model":"Renault Zoe","type":"car"},
-        "64": {"model":"Renault Zoe","type":"car"},
-        "74": {"model":"unknown","type":"van"},
-        "76": {"model":"Mercedes eVito","type":"van"},
-        "77": {"model":"Renault Zoe","type":"car"},
-        "79": {"model":"Peugeot e-Partner","type":"van"},
-        "86": {"model":"Renault Zoe","type":"car"},
-        "91": {"model":"Renault Zoe","type":"car"},
-        "94": {"model":"Renault Zoe","type":"car"},
-        "95": {"model":"Renault Kangoo","type":"van"},
-        "96": {"model":"Renault Zoe","type":"car"},
-        "97": {"model":"Renault Zoe","type":"car"},
-        "99": {"model":"Renault Zoe","type":"car"},
-        "102": {"model":"Renault Megane","type":"car"},
-        "103": {"model":"Opel Vivaro Electric","type":"van"},
-        "105": {"model":"Renault Zoe","type":"car"},
-        "106": {"model":"Renault Zoe","type":"car"},
-        "107": {"model":"Renault Zoe","type":"car"},
-        "109": {"model":"Renault Trafic E-Tech","type":"van"},
-        "111": {"model":"Ford E-Transit","type":"van"}
-    }
-    return car_types.get(vehicle_type_id)["type"] if vehicle_type_id in car_types else "unknown"
-
-    
-
-
-def postcode_mapping(zip_code):
-    post_codes = {
-        1: {"name": "Bronshoj",         "zip_from": 2700, "zip_to": 2700, "setting": 2700},
-        2: {"name": "Kobenhavn K",      "zip_from": 1050, "zip_to": 1473, "setting": 1050},
-        3: {"name": "Kobenhavn N",      "zip_from": 2200, "zip_to": 2200, "setting": 2200},
-        4: {"name": "Kobenhavn NV",     "zip_from": 2400, "zip_to": 2400, "setting": 2400},
-        5: {"name": "Kobenhavn O",      "zip_from": 2100, "zip_to": 2100, "setting": 2100},
-        6: {"name": "Kobenhavn S",      "zip_from": 2300, "zip_to": 2300, "setting": 2300},
-        7: {"name": "Kobenhavn SV",     "zip_from": 2450, "zip_to": 2450, "setting": 2450},
-        8: {"name": "Kobenhavn V",      "zip_from": 1550, "zip_to": 1799, "setting": 1550},
-        9: {"name": "Nordhavn",         "zip_from": 2150, "zip_to": 2150, "setting": 2150},
-        10: {"name": "Valby",           "zip_from": 2500, "zip_to": 2500, "setting": 2500},
-        11: {"name": "Vanlose",         "zip_from": 2720, "zip_to": 2720, "setting": 2720},
-        12: {"name": "Frederiksberg C", "zip_from": 1800, "zip_to": 2000, "setting": 2000},
-        13: {"name": "Hellerup",        "zip_from": 2900, "zip_to": 2900, "setting": 2900},
-        14: {"name": "Soborg",          "zip_from": 2860, "zip_to": 2860, "setting": 2860},
-        15: {"name": "Herlev",          "zip_from": 2730, "zip_to": 2730, "setting": 2730},
-        16: {"name": "Skovlunde",       "zip_from": 2740, "zip_to": 2740, "setting": 2740},
-        17: {"name": "Ballerup",        "zip_from": 2750, "zip_to": 2750, "setting": 2750},
-        18: {"name": "Glostrup",        "zip_from": 2600, "zip_to": 2600, "setting": 2600},
-        19: {"name": "Hvidovre",        "zip_from": 2650, "zip_to": 2650, "setting": 2650},
-        20: {"name": "Albertslund",     "zip_from": 2620, "zip_to": 2620, "setting": 2620},
-        21: {"name": "Taastrup",        "zip_from": 2630, "zip_to": 2630, "setting": 2630},
-        22: {"name": "Brondby Strand",  "zip_from": 2660, "zip_to": 2660, "setting": 2660},
-        23: {"name": "Kgs. Lyngby",     "zip_from": 2800, "zip_to": 2800, "setting": 2800},
-        24: {"name": "Virum",           "zip_from": 2830, "zip_to": 2830, "setting": 2830},
-        25: {"name": "Dyssegoord",      "zip_from": 2870, "zip_to": 2870, "setting": 2870},
-        26: {"name": "Gentofte",        "zip_from": 2820, "zip_to": 2820, "setting": 2820},
-        27: {"name": "Rodovre",         "zip_from": 2610, "zip_to": 2610, "setting": 2610},
-        28: {"name": "Kastrup",         "zip_from": 2770, "zip_to": 2770, "setting": 2770},
-        29: {"name": "Charlottelund",   "zip_from": 2920, "zip_to": 2920, "setting": 2920},
-        30: {"name": "Klampenborg",     "zip_from": 2930, "zip_to": 2930, "setting": 2930},
-        31: {"name": "Bagsvaerd",       "zip_from": 2880, "zip_to": 2880, "setting": 2880}
-    }   
-    
-    for code, info in post_codes.items():
-        if info["zip_from"] <= zip_code <= info["zip_to"]:
-            return info["name"]
-    return "NOT_ANNOTATED"
+        logger.info("Mapped vehicleTypeId to car_type and car_model, zipCode to area names and extracted day_of_week and hour_of_day")
 
+        with metrics.phase("write") as write:
+            grouped.to_csv(args.output, index=False)
+            write.add(rows=len(grouped), bytes=os.path.getsize(args.output))
 
+        logger.info(f"Saved transformed data to {args.output}")
+    metrics.close()
 
 
 if __name__ == "__main__":
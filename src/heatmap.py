@@ -1,8 +1,67 @@
 import argparse
-import pandas as pd
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
 import folium
 from folium.plugins import HeatMap, HeatMapWithTime
 import numpy as np
+import pandas as pd
+
+from grid import bin_points
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+
+CELL_SIZE_M = 50.0
+
+# Weight of one parking in the per-day and per-hour maps
+TIME_POINT_WEIGHT = 0.3
+
+ARTIFACTS = {
+    "static": "artifacts/heatmap_static.html",
+    "day": "artifacts/vehicle_heatmap_per_day.html",
+    "hour": "artifacts/vehicle_heatmap_per_hour.html",
+    "parking_time": "artifacts/vehicle_heatmap_parking_time.html",
+}
+
+
+def _frames(binned):
+    """Per-bucket [[lat, lon, weight], ...] lists and their labels for HeatMapWithTime."""
+    data, index = [], []
+    for bucket, cells in binned.groupby("bucket", sort=True, observed=True):
+        data.append(cells[["lat", "lon", "weight"]].to_numpy().tolist())
+        index.append(str(bucket))
+    return data, index
+
+
+def _time_buckets(times, freq, fmt):
+    """Floor `times` to `freq` and label the buckets with `fmt`, formatting each bucket once."""
+    codes, uniques = pd.factorize(times.dt.floor(freq), sort=True)
+    return pd.Categorical.from_codes(codes, uniques.strftime(fmt))
+
+
+def render_artifact(name, binned, center):
+    """Draw one heatmap from its binned grid and save it to ARTIFACTS[name]."""
+    if name in ("static", "parking_time"):
+        m = folium.Map(location=center, zoom_start=12)
+        points = binned[["lat", "lon", "weight"]].to_numpy().tolist()
+        if name == "static":
+            HeatMap(points).add_to(m)
+        else:
+            HeatMap(points, radius=25, blur=15, min_opacity=0.2, max_zoom=13).add_to(m)
+    else:
+        m = folium.Map(location=center, zoom_start=13)
+        heat_data, time_index = _frames(binned)
+        HeatMapWithTime(
+            heat_data,
+            index=time_index,
+            auto_play=False,
+            max_opacity=0.8,
+            radius=7,
+        ).add_to(m)
+    m.save(ARTIFACTS[name])
+    return ARTIFACTS[name]
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -12,107 +71,97 @@ def main():
         "--input",
         type=str,
         required=False,
-        default="data/group.csv",
+        default="data/data_transformed.csv",
         help="Input CSV file path.",
     )
-
-    args = parser.parse_args()
-
-    df = pd.read_csv(args.input)
-    print(f"Read {len(df)} rows from {args.input}")
-
-    # drop if parking_time is 0
-    df = df[df["parking_time"] > 0].reset_index(drop=True)
-
-    # Drop rows with missing coordinates or time
-    df = df.dropna(subset=["lat", "lon", "end_time"])
-    print(f"{len(df)} rows after dropping rows with missing lat/lon/end_time")
-
-    df["end_time"] = pd.to_datetime(df["end_time"])
-
-    m_static = folium.Map(
-        location=[df["lat"].mean(), df["lon"].mean()],
-        zoom_start=12,
+    parser.add_argument(
+        "--cell-size",
+        type=float,
+        default=CELL_SIZE_M,
+        help="Grid cell size in metres. Points are summed per cell before they go on the maps.",
     )
+    parser.add_argument(
+        "--bins-dir",
+        type=str,
+        help="Also save the binned grids as Parquet files in this directory, for reuse.",
+    )
+    parser.add_argument(
+        "--artifacts",
+        type=str,
+        default=",".join(ARTIFACTS),
+        help=f"Comma-separated heatmaps to build, out of {', '.join(ARTIFACTS)}.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=len(ARTIFACTS),
+        help="Number of worker processes that render the maps.",
+    )
+    add_metrics_arguments(parser)
 
-    heat_data_static = df[["lat", "lon"]].values.tolist()
-    HeatMap(heat_data_static).add_to(m_static)
-
-    m_static.save("artifacts/heatmap_static.html")
-    print("Static heatmap saved to artifacts/heatmap_static.html")
-
-    center_lat = df["lat"].mean()
-    center_lon = df["lon"].mean()
-
-    df["day"] = df["end_time"].dt.date  # calendar day
-
-    heat_data_days = []
-    time_index_days = []
-
-    for day, group in df.groupby("day"):
-        day_points = group[["lat", "lon"]].values.tolist()
-        day_points = [[lat, lon, 0.3] for lat, lon in day_points]
-        heat_data_days.append(day_points)
-        time_index_days.append(day.strftime("%Y-%m-%d"))
-
-    m_days = folium.Map(location=[center_lat, center_lon], zoom_start=13)
-
-    HeatMapWithTime(
-        heat_data_days,
-        index=time_index_days,  
-        auto_play=False,
-        max_opacity=0.8,
-        radius=7,
-    ).add_to(m_days)
-
-    m_days.save("artifacts/vehicle_heatmap_per_day.html")
-    print("Per-day heatmap saved to artifacts/vehicle_heatmap_per_day.html")
-
-    df["hour"] = df["end_time"].dt.floor("H")
-
-    heat_data_hours = []
-    time_index_hours = []
-
-    for hour, group in df.sort_values("hour").groupby("hour"):
-        hour_points = group[["lat", "lon"]].values.tolist()
-        hour_points = [[lat, lon, 0.3] for lat, lon in hour_points]
-        heat_data_hours.append(hour_points)
-        time_index_hours.append(hour.strftime("%Y-%m-%d %H:%M"))
-
-    m_hours = folium.Map(location=[center_lat, center_lon], zoom_start=13)
-
-    HeatMapWithTime(
-        heat_data_hours,
-        index=time_index_hours, 
-        auto_play=False,
-        max_opacity=0.8,
-        radius=7,
-    ).add_to(m_hours)
-
-    m_hours.save("artifacts/vehicle_heatmap_per_hour.html")
-    print("Per-hour heatmap saved to artifacts/vehicle_heatmap_per_hour.html")
-
-    df = df[df["parking_time"] <= 2 * 24 * 60 * 60]
-
-    pt = df["parking_time"].to_numpy() 
-    lo, hi = np.percentile(pt, [5, 95])
-    pt_clip = np.clip(pt, lo, hi)
-
-    w = (pt_clip - lo) / (hi - lo + 1e-9)
-
-    heat_data_parking = df.assign(w=w)[["lat", "lon", "w"]].values.tolist()
-
-    m_parking = folium.Map(location=[center_lat, center_lon], zoom_start=12)
-
-    HeatMap(
-        heat_data_parking,
-        radius=25,      
-        blur=15,
-        min_opacity=0.2,
-        max_zoom=13,
-    ).add_to(m_parking)
+    args = parser.parse_args()
 
-    m_parking.save("artifacts/vehicle_heatmap_parking_time.html")
+    selected = [a.strip() for a in args.artifacts.split(",") if a.strip()]
+    unknown = set(selected) - ARTIFACTS.keys()
+    if unknown:
+        parser.error(f"Unknown artifact(s): {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    metrics = Metrics.from_args("heatmap", args)
+    with metrics.phase("load") as phase:
+        df = load_transformed(args.input, ["lat", "lon", "end_time", "parking_time"])
+        print(f"Read {len(df)} rows from {args.input}")
+        phase.add(rows=len(df))
+
+        # drop if parking_time is 0
+        df = df[df["parking_time"] > 0].reset_index(drop=True)
+
+        # Drop rows with missing coordinates or time
+        df = df.dropna(subset=["lat", "lon", "end_time"])
+        print(f"{len(df)} rows after dropping rows with missing lat/lon/end_time")
+
+    center = [float(df["lat"].mean()), float(df["lon"].mean())]
+    lat, lon = df["lat"].to_numpy(), df["lon"].to_numpy()
+    time_weights = np.full(len(df), TIME_POINT_WEIGHT)
+
+    bins = {}
+    with metrics.phase("bin") as phase:
+        if "static" in selected:
+            bins["static"] = bin_points(lat, lon, args.cell_size)
+        if "day" in selected:
+            days = _time_buckets(df["end_time"], "D", "%Y-%m-%d")
+            bins["day"] = bin_points(lat, lon, args.cell_size, time_weights, days)
+        if "hour" in selected:
+            hours = _time_buckets(df["end_time"], "h", "%Y-%m-%d %H:%M")
+            bins["hour"] = bin_points(lat, lon, args.cell_size, time_weights, hours)
+        if "parking_time" in selected:
+            parked = df["parking_time"].to_numpy() <= 2 * 24 * 60 * 60
+            pt = df["parking_time"].to_numpy()[parked]
+            lo, hi = np.percentile(pt, [5, 95])
+            pt_clip = np.clip(pt, lo, hi)
+
+            w = (pt_clip - lo) / (hi - lo + 1e-9)
+            bins["parking_time"] = bin_points(lat[parked], lon[parked], args.cell_size, w)
+        phase.add(rows=len(df) * len(bins))
+
+    for name, binned in bins.items():
+        print(f"{name}: {int(binned['count'].sum())} points in {len(binned)} occupied cells")
+    if args.bins_dir:
+        Path(args.bins_dir).mkdir(parents=True, exist_ok=True)
+        for name, binned in bins.items():
+            binned.to_parquet(Path(args.bins_dir) / f"{name}.parquet", index=False)
+        print(f"Binned grids saved to {args.bins_dir}")
+
+    # folium serialization is single-threaded, so each map renders in its own process
+    Path("artifacts").mkdir(exist_ok=True)
+    with metrics.phase("render") as phase:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.max_workers, len(bins)))) as executor:
+            futures = [executor.submit(render_artifact, name, binned, center) for name, binned in bins.items()]
+            for future in as_completed(futures):
+                path = future.result()
+                phase.add(bytes=Path(path).stat().st_size)
+                print(f"Heatmap saved to {path}")
+    metrics.close()
 
 if __name__ == "__main__":
     main()
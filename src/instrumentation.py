@@ -0,0 +1,275 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = "artifacts/metrics"
+# Progress of long phases is logged at most this often
+PROGRESS_INTERVAL_S = 30.0
+RSS_SAMPLE_INTERVAL_S = 0.2
+PROFILE_SAMPLE_INTERVAL_S = 0.005
+PROFILE_TOP = 20
+
+
+def _rss_mb():
+    """Current resident set size; falls back to the peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class Phase:
+    """Totals of one named phase over all the times it ran."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rss_mb = 0.0
+        # Work measured in worker threads or processes and added with Metrics.record()
+        self.in_workers = False
+
+    def add(self, rows=0, bytes=0):
+        self.rows += int(rows)
+        self.bytes += int(bytes)
+
+    def to_dict(self):
+        return {
+            "phase": self.name,
+            "calls": self.calls,
+            "wall_s": round(self.wall_s, 3),
+            "cpu_s": round(self.cpu_s, 3),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rows_per_s": round(self.rows / self.wall_s, 1) if self.wall_s and self.rows else None,
+            "mb_per_s": round(self.bytes / 2**20 / self.wall_s, 2) if self.wall_s and self.bytes else None,
+            "peak_rss_mb": None if self.in_workers else round(self.peak_rss_mb, 1),
+            "in_workers": self.in_workers,
+        }
+
+
+class Progress:
+    """Counts work done in a phase and logs the rate and ETA every `interval_s` seconds."""
+
+    def __init__(self, name, total, unit, interval_s):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.interval_s = interval_s
+        self.done = 0
+        self.started = self.last_report = time.perf_counter()
+
+    def update(self, increment=1):
+        self.done += increment
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval_s or self.done == self.total:
+            self.last_report = now
+            rate = self.done / (now - self.started) if now > self.started else 0.0
+            message = f"{self.name}: {self.done}/{self.total} {self.unit}" if self.total else f"{self.name}: {self.done} {self.unit}"
+            if self.total:
+                message += f" ({self.done / self.total:.1%})"
+            message += f", {rate:,.1f} {self.unit}/s"
+            if self.total and rate and self.done < self.total:
+                message += f", ETA {(self.total - self.done) / rate:,.0f}s"
+            logger.info(message)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads of the process, which cProfile cannot see."""
+
+    def __init__(self, interval_s=PROFILE_SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def disable(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def dump(self, path):
+        """Write the stacks in the folded format of flamegraph.pl and speedscope; returns the top functions."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return "\n".join(f"{count / total:6.1%}  {leaf}" for leaf, count in leaves.most_common(PROFILE_TOP))
+
+
+class Metrics:
+    """Timers, row/byte counters and peak memory per named phase of one script run.
+
+    Wrap the phases of a script in `with metrics.phase("name") as p:` and count the
+    work with `p.add(rows=..., bytes=...)`. Work done in worker processes can be added
+    with `record()`. close() logs a summary and writes the per-run metrics file. If
+    `profile` names a phase, that phase is profiled with cProfile (main thread) or a
+    sampling profiler (all threads, `profile_mode="sample"`).
+    """
+
+    def __init__(self, script, path=None, profile=None, profile_mode="cprofile", progress_interval_s=PROGRESS_INTERVAL_S):
+        self.script = script
+        started = time.strftime("%Y%m%d_%H%M%S")
+        self.path = Path(path) if path else Path(METRICS_DIR) / f"{script}_{started}.json"
+        self.profile = profile
+        self.profile_mode = profile_mode
+        self.profiler = None
+        self.progress_interval_s = progress_interval_s
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._active = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+
+    @classmethod
+    def from_args(cls, script, args):
+        return cls(script, args.metrics, args.profile, args.profile_mode)
+
+    def _phase(self, name):
+        with self._lock:
+            if name not in self.phases:
+                self.phases[name] = Phase(name)
+            return self.phases[name]
+
+    def _sample_rss(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL_S):
+            rss = _rss_mb()
+            with self._lock:
+                for phase in self._active:
+                    phase.peak_rss_mb = max(phase.peak_rss_mb, rss)
+
+    @contextmanager
+    def phase(self, name):
+        phase = self._phase(name)
+        phase.calls += 1
+        rss = _rss_mb()
+        phase.peak_rss_mb = max(phase.peak_rss_mb, rss)
+        with self._lock:
+            self._active.append(phase)
+        profiling = name == self.profile
+        if profiling:
+            if self.profiler is None:
+                self.profiler = SamplingProfiler() if self.profile_mode == "sample" else cProfile.Profile()
+            self.profiler.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.wall_s += time.perf_counter() - wall
+            phase.cpu_s += time.process_time() - cpu
+            if profiling:
+                self.profiler.disable()
+            with self._lock:
+                self._active.remove(phase)
+            phase.peak_rss_mb = max(phase.peak_rss_mb, _rss_mb())
+
+    def record(self, name, wall_s, cpu_s=0.0, rows=0, bytes=0, calls=1):
+        """Add work measured in worker threads or processes; the times are summed over workers.
+
+        Measure cpu_s with time.thread_time() in the worker: with more workers than cores
+        the summed wall time also counts the time workers waited for a core or the GIL.
+        """
+        phase = self._phase(name)
+        with self._lock:
+            phase.in_workers = True
+            phase.calls += calls
+            phase.wall_s += wall_s
+            phase.cpu_s += cpu_s
+            phase.add(rows, bytes)
+
+    def progress(self, name, total=None, unit="rows"):
+        return Progress(name, total, unit, self.progress_interval_s)
+
+    def _dump_profile(self):
+        if self.profiler is None:
+            return
+        base = f"{self.path.stem}.{self.profile}"
+        if isinstance(self.profiler, SamplingProfiler):
+            path = self.path.with_name(f"{base}.folded")
+            top = self.profiler.dump(path)
+        else:
+            path = self.path.with_name(f"{base}.prof")
+            self.profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            top = out.getvalue()
+        logger.info(f"Profile of phase {self.profile} saved to {path}\n{top}")
+
+    def close(self):
+        """Log the summary per phase and write the metrics file."""
+        self._stop.set()
+        self._sampler.join()
+        total_s = time.perf_counter() - self.started
+        phases = [p.to_dict() for p in self.phases.values()]
+        for p in phases:
+            rate = f", {p['rows_per_s']:,.0f} rows/s" if p["rows_per_s"] else ""
+            memory = "summed over workers" if p["in_workers"] else f"peak RSS {p['peak_rss_mb']:.0f} MB"
+            logger.info(f"[{self.script}] {p['phase']}: {p['wall_s']:.2f}s wall, {p['cpu_s']:.2f}s cpu{rate}, {memory}")
+        if self.profile and self.profile not in self.phases:
+            logger.warning(f"No phase named {self.profile} ran, nothing was profiled; phases: {', '.join(self.phases)}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "script": self.script,
+                "argv": sys.argv,
+                "started": self.started_at,
+                "wall_s": round(total_s, 3),
+                "peak_rss_mb": round(max([p["peak_rss_mb"] or 0 for p in phases] + [_rss_mb()]), 1),
+                "phases": phases,
+            }, f, indent=2)
+        logger.info(f"[{self.script}] total {total_s:.2f}s, metrics saved to {self.path}")
+        self._dump_profile()
+
+
+def add_metrics_arguments(parser):
+    """The --metrics and --profile options every instrumented script takes."""
+    parser.add_argument("--metrics", type=str, default=None,
+                        help=f"Per-run metrics JSON file (default: {METRICS_DIR}/<script>_<time>.json).")
+    parser.add_argument("--profile", type=str, default=None, metavar="PHASE",
+                        help="Profile this phase, e.g. the slowest one in the metrics summary.")
+    parser.add_argument("--profile-mode", choices=["cprofile", "sample"], default="cprofile",
+                        help="cProfile of the main thread, or a sampling profile of all threads (for thread pools).")
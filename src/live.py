@@ -0,0 +1,278 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+from annotation import area_names
+from build_csv import SnapshotRef, _is_snapshot_name, _parse_datetime_from_filename, _read_single_file
+from data_transformation import MOVE_THRESHOLD
+from grid import bin_points
+from instrumentation import Metrics, add_metrics_arguments
+from stream_segments import SNAPSHOT_COLUMNS, SegmentTracker, extract_zip_code
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+PORT = 8765
+# The scraper writes a snapshot every 2 minutes; polling every few seconds keeps the lag far below that
+POLL_INTERVAL_S = 2.0
+# A file is read once it has not been modified for this long, so half-written files are not parsed
+SETTLE_S = 1.0
+MAX_READ_ATTEMPTS = 3
+# Parking times are reported for the segments that closed in this window
+RECENT_WINDOW_HOURS = 24
+PARKING_TIME_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+# Histogram edges in minutes
+PARKING_TIME_BINS = [0, 15, 60, 240, 720, 1440]
+HOTSPOT_CELL_M = 250.0
+HOTSPOT_TOP = 20
+
+
+class LiveState:
+    """Parking state of the fleet and rolling aggregates, updated one snapshot at a time.
+
+    Segments follow the boundary rule of data_transformation.py through SegmentTracker.
+    After every snapshot the aggregates are recomputed from the snapshot itself (available
+    cars per area, hotspot grid) and from the segments that closed in the last `window`
+    (parking times). Memory is bounded by the fleet size: one open segment per plate and
+    the parking times of the segments that closed in the window.
+    """
+
+    def __init__(self, thr=MOVE_THRESHOLD, window=timedelta(hours=RECENT_WINDOW_HOURS),
+                 hotspot_cell_m=HOTSPOT_CELL_M, hotspot_top=HOTSPOT_TOP):
+        self.tracker = SegmentTracker(thr)
+        self.window = window
+        self.hotspot_cell_m = hotspot_cell_m
+        self.hotspot_top = hotspot_top
+        # (closing snapshot time, parking minutes) of the segments closed in the window, oldest first
+        self.recent = deque()
+        self.snapshots = 0
+        self.last_time = None
+        self.aggregates = {"areas": {}, "parking_time": {}, "hotspots": []}
+        self._lock = threading.Lock()
+
+    def update(self, file_dt, rows):
+        """Feed one snapshot in timestamp order and recompute the aggregates."""
+        closed = self.tracker.update(file_dt, rows)
+        self.recent.extend((file_dt, segment[5]) for segment in closed)
+        cutoff = file_dt - self.window
+        while self.recent and self.recent[0][0] < cutoff:
+            self.recent.popleft()
+
+        aggregates = {
+            "areas": self._areas(rows),
+            "parking_time": self._parking_time(),
+            "hotspots": self._hotspots(rows),
+        }
+        with self._lock:
+            self.aggregates = aggregates
+            self.snapshots += 1
+            self.last_time = file_dt
+        return closed
+
+    @staticmethod
+    def _areas(rows):
+        # Snapshots list the cars that are free to rent, so every row is an available car
+        areas = Counter(area_names([extract_zip_code(row.get("zipCode")) for row in rows]).tolist())
+        return dict(areas.most_common())
+
+    def _parking_time(self):
+        minutes = np.fromiter((pt for _, pt in self.recent), dtype=np.float64, count=len(self.recent))
+        result = {"window_hours": self.window.total_seconds() / 3600, "segments": len(minutes)}
+        if len(minutes):
+            result["mean_min"] = round(float(minutes.mean()), 1)
+            result["quantiles_min"] = {
+                f"p{round(q * 100)}": float(v) for q, v in zip(PARKING_TIME_QUANTILES, np.quantile(minutes, PARKING_TIME_QUANTILES))
+            }
+            counts, _ = np.histogram(minutes, bins=PARKING_TIME_BINS + [np.inf])
+            labels = [f"{lo}-{hi}" for lo, hi in zip(PARKING_TIME_BINS, PARKING_TIME_BINS[1:])] + [f"{PARKING_TIME_BINS[-1]}+"]
+            result["histogram_min"] = dict(zip(labels, counts.tolist()))
+        return result
+
+    def _hotspots(self, rows):
+        lat = np.array([float("nan") if row.get("lat") is None else row["lat"] for row in rows], dtype=np.float64)
+        lon = np.array([float("nan") if row.get("lon") is None else row["lon"] for row in rows], dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        if not valid.any():
+            return []
+        cells = bin_points(lat[valid], lon[valid], self.hotspot_cell_m)
+        top = cells.nlargest(self.hotspot_top, "count")
+        return [{"lat": float(r.lat), "lon": float(r.lon), "cars": int(r.count)} for r in top.itertuples()]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "snapshots": self.snapshots,
+                "last_snapshot": self.last_time.isoformat() if self.last_time else None,
+                "plates": len(self.tracker.open),
+                **self.aggregates,
+            }
+
+
+class SnapshotWatcher:
+    """Finds the new snapshots of a directory, in timestamp order.
+
+    Only the high-water mark (the timestamp of the last snapshot handed out) is kept,
+    not the names of all files seen, so a directory that grows for months costs no
+    memory. A snapshot that lands after a newer one is skipped, since the segments
+    cannot be rewound.
+    """
+
+    def __init__(self, input_path, since=None, settle_s=SETTLE_S):
+        self.input_path = Path(input_path)
+        self.high_water_mark = since or ""
+        self.settle_s = settle_s
+
+    def newest(self):
+        stamps = [_parse_datetime_from_filename(Path(e.name)) for e in os.scandir(self.input_path) if _is_snapshot_name(e.name)]
+        return max((s for s in stamps if s), default=None)
+
+    def poll(self):
+        """New snapshots that have settled, oldest first."""
+        now = time.time()
+        found = []
+        for entry in os.scandir(self.input_path):
+            if not entry.is_file() or not _is_snapshot_name(entry.name):
+                continue
+            stamp = _parse_datetime_from_filename(Path(entry.name))
+            if stamp is None or stamp <= self.high_water_mark:
+                continue
+            st = entry.stat()
+            if now - st.st_mtime < self.settle_s:
+                continue
+            found.append((stamp, SnapshotRef(entry.name, Path(entry.path), st.st_size, st.st_mtime_ns)))
+        found.sort()
+        return found
+
+    def advance(self, stamp):
+        self.high_water_mark = max(self.high_water_mark, stamp)
+
+
+class LiveServer(ThreadingHTTPServer):
+    """Serves the aggregates of a LiveState as JSON on /, /status, /areas, /parking-time and /hotspots."""
+
+    daemon_threads = True
+
+    def __init__(self, address, state, status):
+        self.state = state
+        # Callable that returns the watcher's status, e.g. the latency of the last snapshot
+        self.status = status
+        super().__init__(address, _Handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        snapshot = self.server.state.to_dict()
+        routes = {
+            "/": lambda: {**self.server.status(), **snapshot},
+            "/status": lambda: {**self.server.status(), **{k: snapshot[k] for k in ("snapshots", "last_snapshot", "plates")}},
+            "/areas": lambda: snapshot["areas"],
+            "/parking-time": lambda: snapshot["parking_time"],
+            "/hotspots": lambda: snapshot["hotspots"],
+        }
+        route = routes.get(urlparse(self.path).path.rstrip("/") or "/")
+        code, body = (200, route()) if route else (404, {"error": f"unknown path, try one of {', '.join(routes)}"})
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def tail(watcher, state, metrics, stop, poll_interval_s=POLL_INTERVAL_S, status=None):
+    """Feed every new snapshot of `watcher` to `state` until `stop` is set."""
+    attempts = Counter()
+    status = {} if status is None else status
+    catching_up = True
+    while not stop.is_set():
+        for stamp, ref in watcher.poll():
+            with metrics.phase("read"):
+                result = _read_single_file(ref, SNAPSHOT_COLUMNS)
+            if result is None:
+                attempts[ref.name] += 1
+                if attempts[ref.name] < MAX_READ_ATTEMPTS:
+                    # Keep the order: retry this snapshot before any newer one
+                    break
+                logger.warning(f"Skipping {ref.name} after {MAX_READ_ATTEMPTS} failed reads")
+            else:
+                rows = result[0]
+                with metrics.phase("update") as phase:
+                    state.update(datetime.fromisoformat(stamp), rows)
+                    phase.add(rows=len(rows))
+                if not catching_up:
+                    # From the moment the scraper finished the file to the aggregates being served
+                    latency = time.time() - ref.mtime_ns / 1e9
+                    status["last_latency_s"] = round(latency, 3)
+                    status["max_latency_s"] = max(status.get("max_latency_s", 0.0), round(latency, 3))
+            attempts.pop(ref.name, None)
+            watcher.advance(stamp)
+        else:
+            # Only a poll that got through every snapshot it found ends the catch-up
+            if catching_up:
+                catching_up = False
+                logger.info(f"Caught up with {state.snapshots} snapshots of {len(state.tracker.open)} plates, now tailing")
+        status["polled"] = datetime.now().isoformat(timespec="seconds")
+        stop.wait(poll_interval_s)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Tail the snapshot directory and serve live fleet aggregates as JSON over HTTP."
+    )
+    parser.add_argument('--input', type=str, default="data/raw", help="Directory the snapshots land in.")
+    parser.add_argument('--host', type=str, default=HOST, help="Address to serve on.")
+    parser.add_argument('--port', type=int, default=PORT, help="Port to serve on.")
+    parser.add_argument('--thr', type=float, default=MOVE_THRESHOLD, help="Lat/lon change that counts as a move.")
+    parser.add_argument('--window', type=float, default=RECENT_WINDOW_HOURS,
+                        help="Hours of closed segments in the parking-time distribution; existing snapshots "
+                             "of this many hours before the newest one are read at start-up.")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL_S, help="Seconds between directory scans.")
+    parser.add_argument('--cell-size', type=float, default=HOTSPOT_CELL_M, help="Hotspot grid cell size in metres.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if not Path(args.input).is_dir():
+        parser.error(f"{args.input} is not a directory")
+
+    window = timedelta(hours=args.window)
+    watcher = SnapshotWatcher(args.input)
+    newest = watcher.newest()
+    if newest:
+        watcher.high_water_mark = (datetime.fromisoformat(newest) - window).isoformat()
+    state = LiveState(args.thr, window, args.cell_size)
+    status = {"input": str(Path(args.input).resolve())}
+
+    metrics = Metrics.from_args("live", args)
+    server = LiveServer((args.host, args.port), state, lambda: dict(status))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving live aggregates on http://{args.host}:{server.server_address[1]}/")
+
+    stop = threading.Event()
+    # Stop cleanly under a service manager too, which sends SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        tail(watcher, state, metrics, stop, args.poll_interval, status)
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        server.shutdown()
+        metrics.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import pandas as pd
+
+# Typed schemas for the CSVs of the pipeline. Repeated strings load as categoricals,
+# small integers as narrow (nullable where the column can be empty) types, and
+# timestamps are parsed with the fixed format their writer uses.
+
+# Combined snapshots written by build_csv.py
+COMBINED_SCHEMA = {
+    "carId": "Int32",
+    "serviceType": "Int16",
+    "title": "category",
+    # Segmentation compares raw positions against MOVE_THRESHOLD and writes them
+    # out again, so the combined file keeps full precision coordinates
+    "lat": "float64",
+    "lon": "float64",
+    "licencePlate": "category",
+    "fuelLevel": "Int16",
+    "vehicleStateId": "Int16",
+    "vehicleTypeId": "Int16",
+    "pricingTime": "category",
+    "pricingParking": "category",
+    "reservationState": "Int16",
+    "isClean": "boolean",
+    "isDamaged": "boolean",
+    "distance": "category",
+    "address": "category",
+    "zipCode": "category",
+    "city": "category",
+    "locationId": "Int16",
+}
+COMBINED_DATETIMES = {"file_datetime": "%Y-%m-%dT%H:%M:%S"}
+
+# Parking segments written by data_transformation.py and stream_segments.py
+TRANSFORMED_SCHEMA = {
+    "licencePlate": "category",
+    "lat": "float32",
+    "lon": "float32",
+    "parking_time": "int32",
+    "vehicleTypeId": "category",
+    "zipCode": "int16",
+    "car_type": "category",
+    "car_model": "category",
+    "area_name": "category",
+    "poi": "category",
+    "poi_category": "category",
+    "day_of_week_start": "category",
+    "hour_of_day_start": "int8",
+    "day_of_week_end": "category",
+    "hour_of_day_end": "int8",
+}
+TRANSFORMED_DATETIMES = {"start_time": "%Y-%m-%d %H:%M:%S", "end_time": "%Y-%m-%d %H:%M:%S"}
+
+
+def _parse_datetimes(df, formats):
+    for column, fmt in formats.items():
+        if column not in df.columns:
+            continue
+        parsed = pd.to_datetime(df[column], format=fmt, errors="coerce")
+        # Fall back to ISO8601 if the writer used another layout (e.g. dates only)
+        if (parsed.isna() & df[column].notna()).any():
+            parsed = pd.to_datetime(df[column], format="ISO8601", errors="coerce")
+        df[column] = parsed
+    return df
+
+
+def read_typed_csv(path, schema, datetimes, columns=None, chunksize=None):
+    """Read a CSV with the dtypes of `schema`, parsing `datetimes` with their fixed formats.
+
+    `path` may also be a seekable buffer. Only `columns` are read if given. Surrounding
+    whitespace in header names is ignored.
+    Returns a DataFrame, or an iterator of DataFrames if `chunksize` is set.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    if hasattr(path, "seek"):
+        # A buffer was consumed by reading the header
+        path.seek(0)
+    names = {c: c.strip() for c in header}
+    usecols = [c for c in header if columns is None or names[c] in columns]
+    missing = set(columns or []) - {names[c] for c in usecols}
+    if missing:
+        raise ValueError(f"{path} has no column(s): {', '.join(sorted(missing))}")
+    dtype = {c: schema[names[c]] for c in usecols if names[c] in schema}
+    dtype.update({c: "object" for c in usecols if names[c] in datetimes})
+
+    def finish(df):
+        df = df.rename(columns=names)
+        return _parse_datetimes(df, datetimes)
+
+    reader = pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize)
+    if chunksize is None:
+        return finish(reader)
+    return (finish(chunk) for chunk in reader)
+
+
+def load_combined(path, columns=None, chunksize=None):
+    """Load the combined snapshot CSV from build_csv.py with COMBINED_SCHEMA."""
+    return read_typed_csv(path, COMBINED_SCHEMA, COMBINED_DATETIMES, columns, chunksize)
+
+
+def load_transformed(path, columns=None, chunksize=None):
+    """Load parking segments from data_transformation.py with TRANSFORMED_SCHEMA."""
+    return read_typed_csv(path, TRANSFORMED_SCHEMA, TRANSFORMED_DATETIMES, columns, chunksize)
@@ -0,0 +1,120 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+
+logger = logging.getLogger(__name__)
+
+# Columns of the parking segments the movement table is derived from
+SEGMENT_COLUMNS = [
+    "licencePlate", "car_type", "vehicleTypeId", "start_time", "end_time",
+    "lat", "lon", "zipCode", "hour_of_day_end",
+]
+
+
+def movement_table(segments):
+    """Trips between consecutive parking segments of each licence plate.
+
+    A trip starts when a segment ends and ends when the plate's next segment starts.
+    The segments are sorted once by plate and start time; the last segment of every
+    plate has no trip.
+    """
+    plates, _ = pd.factorize(segments["licencePlate"], sort=True)
+    start = segments["start_time"].to_numpy()
+    order = np.lexsort((start, plates))
+    plates = plates[order]
+    # Row i moves from segment i to segment i + 1 of the same plate
+    moves = np.flatnonzero((plates[1:] == plates[:-1]) & ~np.isnat(start[order][1:]))
+    here, nxt = order[moves], order[moves + 1]
+
+    def col(name, rows):
+        # take() on the underlying array keeps categoricals as they are
+        return segments[name].array.take(rows)
+
+    start_move = col("end_time", here)
+    end_move = col("start_time", nxt)
+    duration = pd.Series(end_move - start_move)
+    return pd.DataFrame({
+        "licencePlate": col("licencePlate", here),
+        "car_type": col("car_type", here),
+        "vehicleTypeId": col("vehicleTypeId", here),
+        "start_move_time": start_move,
+        "end_move_time": end_move,
+        "next_start_time": end_move,
+        "start_lat": col("lat", here),
+        "start_lon": col("lon", here),
+        "end_lat": col("lat", nxt),
+        "end_lon": col("lon", nxt),
+        "start_zip": col("zipCode", here),
+        "end_zip": col("zipCode", nxt),
+        "hour_of_day_end": col("hour_of_day_end", here),
+        "move_duration": duration,
+        "rental_minutes": duration.dt.total_seconds() / 60,
+        "date": pd.DatetimeIndex(start_move).normalize(),
+    })
+
+
+def utilization(movements, freq="D", max_duration=None, by=None, n_vehicles=None):
+    """Rental hours per day (freq="D") or hour (freq="h"), optionally per `by` column.
+
+    Trips count towards the period they start in. Trips longer than `max_duration`
+    (a Timedelta) are dropped. The per-vehicle average divides by `n_vehicles`, a number
+    or a dict keyed by the `by` values; it defaults to the plates in `movements`
+    before filtering.
+    """
+    if n_vehicles is None:
+        n_vehicles = (
+            movements["licencePlate"].nunique() if by is None
+            else movements.groupby(by, observed=True)["licencePlate"].nunique().to_dict()
+        )
+    if max_duration is not None:
+        movements = movements[movements["move_duration"] <= max_duration]
+    period = "date" if freq == "D" else "hour"
+    keys = [movements["start_move_time"].dt.floor(freq).rename(period)]
+    if by is not None:
+        keys.append(movements[by])
+    use = movements.groupby(keys, observed=True)["rental_minutes"].sum().reset_index()
+    use["total_hours"] = use["rental_minutes"] / 60
+    vehicles = use[by].map(n_vehicles).astype(float) if isinstance(n_vehicles, dict) else n_vehicles
+    use["av_rent_hour_per_car"] = use["total_hours"] / vehicles
+    return use.sort_values([period] + ([by] if by is not None else [])).reset_index(drop=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Derive trips and daily utilization from the parking segments.")
+    parser.add_argument('--input', type=str, required=True, help="Transformed CSV from data_transformation.py.")
+    parser.add_argument('--output', type=str, required=True, help="Output CSV of the trips.")
+    parser.add_argument('--utilization', type=str, help="Also write the daily utilization series to this CSV.")
+    parser.add_argument('--max-duration-hours', type=float,
+                        help="Leave out trips longer than this from the utilization, e.g. 24.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = Metrics.from_args("movements", args)
+    with metrics.phase("load") as phase:
+        segments = load_transformed(args.input, SEGMENT_COLUMNS)
+        phase.add(rows=len(segments))
+    with metrics.phase("trips") as phase:
+        movements = movement_table(segments)
+        phase.add(rows=len(segments))
+    with metrics.phase("write") as phase:
+        movements.to_csv(args.output, index=False)
+        phase.add(rows=len(movements))
+    logger.info(f"Saved {len(movements)} trips to {args.output}")
+
+    if args.utilization:
+        max_duration = None if args.max_duration_hours is None else pd.Timedelta(hours=args.max_duration_hours)
+        with metrics.phase("utilization") as phase:
+            utilization(movements, max_duration=max_duration).to_csv(args.utilization, index=False)
+            phase.add(rows=len(movements))
+        logger.info(f"Saved daily utilization to {args.utilization}")
+    metrics.close()
+
+
+if __name__ == "__main__":
+    main()
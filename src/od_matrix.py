@@ -0,0 +1,179 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from annotation import area_names
+from grid import cell_size_deg
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+from movements import SEGMENT_COLUMNS, movement_table
+
+logger = logging.getLogger(__name__)
+
+ZONINGS = ("area", "grid")
+CELL_SIZE_M = 500.0
+OD_FREQ = "h"
+
+
+def _grid_zones(lat, lon, cell_m):
+    """Label of the grid cell of `cell_m` metres around each position, e.g. '55.6823,12.5701' for its centre."""
+    dlat, dlon = cell_size_deg(cell_m)
+    cells = pd.DataFrame({
+        "y": np.floor(np.asarray(lat, dtype=np.float64) / dlat),
+        "x": np.floor(np.asarray(lon, dtype=np.float64) / dlon),
+    })
+    # Format each distinct cell once
+    codes, uniques = pd.MultiIndex.from_frame(cells).factorize()
+    labels = np.array(
+        [f"{(y + 0.5) * dlat:.4f},{(x + 0.5) * dlon:.4f}" for y, x in uniques], dtype=object
+    )
+    return labels[codes]
+
+
+class ODMatrix:
+    """Trip counts per time bucket, origin zone and destination zone, stored as sparse triplets."""
+
+    def __init__(self, zones, buckets, bucket, origin, destination, trips):
+        self.zones = np.asarray(zones, dtype=object)
+        self.buckets = pd.DatetimeIndex(buckets)
+        self.bucket = np.asarray(bucket, dtype=np.int64)
+        self.origin = np.asarray(origin, dtype=np.int64)
+        self.destination = np.asarray(destination, dtype=np.int64)
+        self.trips = np.asarray(trips, dtype=np.int64)
+
+    @classmethod
+    def from_trips(cls, start_times, origins, destinations, freq=OD_FREQ):
+        """Count trips per (start bucket of `freq`, origin, destination) in one vectorized pass."""
+        bucket, buckets = pd.factorize(pd.DatetimeIndex(start_times).floor(freq), sort=True)
+        # One zone numbering for both ends, so the matrices are square
+        zone, zones = pd.factorize(np.concatenate([np.asarray(origins, dtype=object), np.asarray(destinations, dtype=object)]), sort=True)
+        origin, destination = zone[:len(bucket)], zone[len(bucket):]
+        return cls._accumulate(zones, buckets, bucket, origin, destination, np.ones(len(bucket), dtype=np.int64))
+
+    @classmethod
+    def _accumulate(cls, zones, buckets, bucket, origin, destination, trips):
+        n = len(zones)
+        keys = (bucket.astype(np.int64) * n + origin) * n + destination
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        return cls(
+            zones, buckets,
+            unique_keys // (n * n), (unique_keys // n) % n, unique_keys % n,
+            np.bincount(inverse, weights=trips, minlength=len(unique_keys)).astype(np.int64),
+        )
+
+    @classmethod
+    def from_segments(cls, segments, zoning="area", freq=OD_FREQ, cell_m=CELL_SIZE_M):
+        """OD matrix of the trips between consecutive parking segments of each plate."""
+        moves = movement_table(segments)
+        if zoning == "area":
+            origins, destinations = area_names(moves["start_zip"]), area_names(moves["end_zip"])
+        elif zoning == "grid":
+            origins = _grid_zones(moves["start_lat"], moves["start_lon"], cell_m)
+            destinations = _grid_zones(moves["end_lat"], moves["end_lon"], cell_m)
+        else:
+            raise ValueError(f"Unknown zoning {zoning!r}, use one of {ZONINGS}")
+        return cls.from_trips(moves["start_move_time"], origins, destinations, freq)
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            zones=self.zones.astype(str),
+            buckets=self.buckets.as_unit("ns").asi8,
+            bucket=self.bucket.astype(np.int32),
+            origin=self.origin.astype(np.int32),
+            destination=self.destination.astype(np.int32),
+            trips=self.trips.astype(np.int32),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            return cls(
+                f["zones"].astype(object), pd.to_datetime(f["buckets"]),
+                f["bucket"], f["origin"], f["destination"], f["trips"],
+            )
+
+    def _select(self, start=None, end=None):
+        """Mask of the triplets whose bucket lies in [start, end)."""
+        times = self.buckets[self.bucket]
+        mask = np.ones(len(self.bucket), dtype=bool)
+        if start is not None:
+            mask &= times >= pd.Timestamp(start)
+        if end is not None:
+            mask &= times < pd.Timestamp(end)
+        return mask
+
+    def matrix(self, start=None, end=None):
+        """Zones x zones sparse matrix of the trips that started in [start, end)."""
+        mask = self._select(start, end)
+        n = len(self.zones)
+        return sparse.csr_matrix(
+            (self.trips[mask], (self.origin[mask], self.destination[mask])), shape=(n, n)
+        )
+
+    def top_flows(self, k=10, start=None, end=None, exclude_self=False):
+        """The `k` largest origin -> destination flows in [start, end)."""
+        coo = self.matrix(start, end).tocoo()
+        keep = coo.row != coo.col if exclude_self else np.ones(coo.nnz, dtype=bool)
+        rows, cols, trips = coo.row[keep], coo.col[keep], coo.data[keep]
+        top = np.argsort(-trips, kind="stable")[:k]
+        return pd.DataFrame({
+            "origin": self.zones[rows[top]],
+            "destination": self.zones[cols[top]],
+            "trips": trips[top],
+        })
+
+    def rollup(self, freq=None):
+        """Coarser buckets, e.g. "D" or "W"; freq=None sums everything into one bucket."""
+        if freq is None:
+            bucket = np.zeros(len(self.bucket), dtype=np.int64)
+            buckets = self.buckets[:1] if len(self.buckets) else self.buckets
+        else:
+            bucket, buckets = pd.factorize(self.buckets.floor(freq)[self.bucket], sort=True)
+        return self._accumulate(self.zones, buckets, bucket, self.origin, self.destination, self.trips)
+
+    def to_frame(self):
+        """Long table of the non-zero cells."""
+        return pd.DataFrame({
+            "bucket": self.buckets[self.bucket],
+            "origin": self.zones[self.origin],
+            "destination": self.zones[self.destination],
+            "trips": self.trips,
+        })
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build time-bucketed origin-destination matrices of the trips.")
+    parser.add_argument('--input', type=str, required=True, help="Transformed CSV from data_transformation.py.")
+    parser.add_argument('--output', type=str, required=True, help="Output .npz file of the OD matrices.")
+    parser.add_argument('--zones', choices=ZONINGS, default="area", help="Map trip ends to areas or to grid cells.")
+    parser.add_argument('--cell-size', type=float, default=CELL_SIZE_M, help="Grid cell size in metres for --zones grid.")
+    parser.add_argument('--freq', type=str, default=OD_FREQ, help="Time bucket of the matrices, e.g. h, D or W.")
+    parser.add_argument('--top', type=int, default=10, help="Print the largest flows over the whole period.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = Metrics.from_args("od_matrix", args)
+    with metrics.phase("load") as phase:
+        segments = load_transformed(args.input, SEGMENT_COLUMNS)
+        phase.add(rows=len(segments))
+    with metrics.phase("matrix") as phase:
+        od = ODMatrix.from_segments(segments, args.zones, args.freq, args.cell_size)
+        phase.add(rows=len(segments))
+    with metrics.phase("save"):
+        od.save(args.output)
+    metrics.close()
+    logger.info(
+        f"Saved {len(od.trips)} non-zero cells of {int(od.trips.sum())} trips over {len(od.buckets)} buckets "
+        f"and {len(od.zones)} zones to {args.output}"
+    )
+    if args.top:
+        print(od.top_flows(args.top, exclude_self=True).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+SRC = Path(__file__).resolve().parent
+ROOT = SRC.parent
+STATE_FILE = "data/.pipeline/state.json"
+LOG_DIR = "data/.pipeline/logs"
+MAX_WORKERS = 4
+HASH_BLOCK_SIZE = 1 << 20
+
+RAW = "data/raw"
+COMBINED = "data/output.csv"
+TRANSFORMED = "data/data_transformed.csv"
+
+
+class Stage(NamedTuple):
+    script: str
+    args: list[str]
+    inputs: list[str]
+    outputs: list[str]
+    # Module-level constants of the script that shape its output, recorded in the stage key
+    params: list[str] = []
+
+
+STAGES = {
+    "ingest": Stage("build_csv.py", ["--input", RAW, "--output", COMBINED, "--append"], [RAW], [COMBINED]),
+    "transform": Stage("data_transformation.py", ["--input", COMBINED, "--output", TRANSFORMED],
+                       [COMBINED], [TRANSFORMED], ["MOVE_THRESHOLD"]),
+    "cube": Stage("cube.py", ["--input", TRANSFORMED, "--output", "data/cube"], [TRANSFORMED],
+                  ["data/cube/cube.parquet", "data/cube/plates.parquet"]),
+    "cluster": Stage("cluster.py", ["--input", TRANSFORMED], [TRANSFORMED], ["artifacts/cluster_map.html"],
+                     ["EPS_KM", "ROUND_DECIMALS", "MIN_SAMPLES", "MIN_CLUSTER_SIZE_DEFAULT"]),
+    "heatmap": Stage("heatmap.py", ["--input", TRANSFORMED], [TRANSFORMED],
+                     ["artifacts/heatmap_static.html", "artifacts/vehicle_heatmap_per_day.html",
+                      "artifacts/vehicle_heatmap_per_hour.html", "artifacts/vehicle_heatmap_parking_time.html"],
+                     ["CELL_SIZE_M", "TIME_POINT_WEIGHT"]),
+    # The report is the stage log
+    "stats": Stage("stats.py", ["--input", TRANSFORMED], [TRANSFORMED], []),
+}
+
+
+def _dependencies(name):
+    """Stages that write an input of stage `name`."""
+    inputs = set(STAGES[name].inputs)
+    return [other for other, stage in STAGES.items() if inputs & set(stage.outputs)]
+
+
+def _local_modules(script, seen=None):
+    """`script` and the modules of src/ it imports, directly or through each other."""
+    seen = set() if seen is None else seen
+    if script in seen:
+        return seen
+    seen.add(script)
+    for node in ast.walk(ast.parse((SRC / script).read_text(encoding="utf-8"))):
+        names = [a.name for a in node.names] if isinstance(node, ast.Import) else [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+        for module in names:
+            if (SRC / f"{module}.py").exists():
+                _local_modules(f"{module}.py", seen)
+    return seen
+
+
+def _module_constants(script, names):
+    values = {}
+    for node in ast.parse((SRC / script).read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and getattr(node.targets[0], "id", None) in names:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+    return values
+
+
+class Pipeline:
+    """Runs the stages as a DAG and skips the ones whose key has not changed since their last run.
+
+    The key of a stage is a hash of the contents of its inputs, its arguments and
+    parameters and the source of its script and every src/ module it imports. A stage
+    is skipped when its key matches the recorded one and its outputs are unchanged on
+    disk. Stages whose dependencies are done run in parallel.
+    """
+
+    def __init__(self, state_file=STATE_FILE, log_dir=LOG_DIR):
+        self.state_file = ROOT / state_file
+        self.log_dir = ROOT / log_dir
+        self.state = {"files": {}, "stages": {}}
+        if self.state_file.exists():
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save(self):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def digest(self, path):
+        """Content hash of a file, or of a directory listing (names, sizes and mtimes, like build_csv's manifest).
+
+        File hashes are memoized by size and mtime, so unchanged files are not read again.
+        """
+        path = ROOT / path
+        if not path.exists():
+            return None
+        if path.is_dir():
+            h = hashlib.sha1()
+            for p in sorted(path.rglob("*")):
+                if p.is_file():
+                    st = p.stat()
+                    h.update(f"{p.relative_to(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+            return h.hexdigest()
+        st = path.stat()
+        cached = self.state["files"].get(str(path))
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["sha1"]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                h.update(block)
+        self.state["files"][str(path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": h.hexdigest()}
+        return h.hexdigest()
+
+    def key(self, name):
+        stage = STAGES[name]
+        code = {m: hashlib.sha1((SRC / m).read_bytes()).hexdigest() for m in sorted(_local_modules(stage.script))}
+        if "poi.py" in code:
+            # POIs are data, but they change the output like code does
+            code["config/pois.json"] = self.digest("config/pois.json")
+        material = {
+            "args": stage.args,
+            "params": _module_constants(stage.script, stage.params),
+            "inputs": {p: self.digest(p) for p in stage.inputs},
+            "code": code,
+        }
+        return hashlib.sha1(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def is_current(self, name, key):
+        record = self.state["stages"].get(name)
+        return (
+            record is not None and record["key"] == key
+            and all(self.digest(p) == record["outputs"].get(p) for p in STAGES[name].outputs)
+        )
+
+    def run_stage(self, name):
+        stage = STAGES[name]
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        for output in stage.outputs:
+            (ROOT / output).parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        with open(self.log_dir / f"{name}.log", "wb") as log:
+            result = subprocess.run([sys.executable, str(SRC / stage.script), *stage.args], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        return result.returncode, time.perf_counter() - started
+
+    def run(self, targets, force=(), max_workers=MAX_WORKERS, dry_run=False):
+        """Bring `targets` and the stages they depend on up to date; returns the names of the stages that failed."""
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(_dependencies(name))
+        waiting = {name: set(_dependencies(name)) for name in STAGES if name in needed}
+        done, failed, running = set(), [], {}
+        # Stages a dry run would rerun; everything downstream of them would rerun too
+        dirty = set()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while waiting or running:
+                # Skipped stages are done at once, which can make more stages ready
+                while ready := [n for n, deps in waiting.items() if deps <= done]:
+                    name = ready[0]
+                    del waiting[name]
+                    # A stage's key depends on its inputs, so it is only known once its dependencies are done
+                    key = self.key(name)
+                    if name not in force and not (set(_dependencies(name)) & dirty) and self.is_current(name, key):
+                        logger.info(f"{name}: up to date, skipped")
+                        done.add(name)
+                    elif dry_run:
+                        logger.info(f"{name}: would run {STAGES[name].script}")
+                        dirty.add(name)
+                        done.add(name)
+                    else:
+                        logger.info(f"{name}: running {STAGES[name].script}")
+                        running[executor.submit(self.run_stage, name)] = (name, key)
+                if not running:
+                    if waiting:
+                        # Whatever is left depends on a failed stage
+                        logger.error(f"Not run because a dependency failed: {', '.join(sorted(waiting))}")
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, key = running.pop(future)
+                    returncode, seconds = future.result()
+                    if returncode != 0:
+                        logger.error(f"{name}: failed with exit code {returncode} after {seconds:.1f}s, see {self.log_dir / name}.log")
+                        failed.append(name)
+                        self.state["stages"].pop(name, None)
+                        continue
+                    outputs = {p: self.digest(p) for p in STAGES[name].outputs}
+                    self.state["stages"][name] = {"key": key, "outputs": outputs, "seconds": round(seconds, 1)}
+                    self.save()
+                    logger.info(f"{name}: done in {seconds:.1f}s")
+                    done.add(name)
+        if not dry_run:
+            self.save()
+        return failed
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", datefmt="%H:%M:%S")
+    parser = argparse.ArgumentParser(description="Run the data pipeline, skipping stages whose inputs, parameters and code are unchanged.")
+    parser.add_argument("stages", nargs="*", default=list(STAGES), help=f"Stages to bring up to date, out of {', '.join(STAGES)} (default: all).")
+    parser.add_argument("--force", type=str, default="", help="Comma-separated stages to rerun even if they are up to date, or 'all'.")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Number of stages that may run at the same time.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print which stages would run.")
+    args = parser.parse_args()
+
+    force = set(STAGES) if args.force == "all" else {s.strip() for s in args.force.split(",") if s.strip()}
+    unknown = (set(args.stages) | force) - STAGES.keys()
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    failed = Pipeline().run(args.stages, force, args.max_workers, args.dry_run)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
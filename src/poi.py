@@ -0,0 +1,84 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from annotation import NOT_ANNOTATED
+
+# Named points of interest, e.g. airports and stations, with a radius in metres each
+POI_CONFIG = Path(__file__).resolve().parent.parent / "config" / "pois.json"
+
+EARTH_RADIUS_M = 6371008.8
+QUERY_CHUNK_SIZE = 500_000
+
+
+class PoiIndex:
+    """Points of interest in a haversine ball tree, for tagging positions with the nearest POI."""
+
+    def __init__(self, pois):
+        self.names = np.array([p["name"] for p in pois] + [NOT_ANNOTATED], dtype=object)
+        self.categories = np.array([p["category"] for p in pois] + [NOT_ANNOTATED], dtype=object)
+        self.radius_m = np.array([float(p["radius_m"]) for p in pois], dtype=np.float64)
+        coords = np.radians(np.array([[p["lat"], p["lon"]] for p in pois], dtype=np.float64).reshape(-1, 2))
+        self.tree = BallTree(coords, metric="haversine") if len(pois) else None
+
+    @classmethod
+    def from_file(cls, path=POI_CONFIG):
+        """Load POIs from a JSON list of {name, category, lat, lon, radius_m} objects."""
+        with open(path, "r", encoding="utf-8") as f:
+            pois = json.load(f)
+        missing = [p for p in pois if not {"name", "category", "lat", "lon", "radius_m"} <= p.keys()]
+        if missing:
+            raise ValueError(f"POI entries in {path} need name, category, lat, lon and radius_m: {missing[0]}")
+        return cls(pois)
+
+    def nearest(self, lat, lon):
+        """Index of the nearest POI whose radius covers each position (-1 if none) and its distance in metres."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        idx = np.full(len(lat), -1, dtype=np.int64)
+        dist = np.full(len(lat), np.nan)
+        if self.tree is None:
+            return idx, dist
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        for start in range(0, len(valid), QUERY_CHUNK_SIZE):
+            rows = valid[start:start + QUERY_CHUNK_SIZE]
+            points = np.radians(np.column_stack([lat[rows], lon[rows]]))
+            # Candidates within the largest radius, nearest first
+            ind, d = self.tree.query_radius(
+                points, r=self.radius_m.max() / EARTH_RADIUS_M, return_distance=True, sort_results=True
+            )
+            lengths = np.fromiter((len(i) for i in ind), dtype=np.int64, count=len(ind))
+            if not lengths.any():
+                continue
+            cand = np.concatenate(ind)
+            cand_m = np.concatenate(d) * EARTH_RADIUS_M
+            owner = np.repeat(np.arange(len(rows)), lengths)
+            inside = cand_m <= self.radius_m[cand]
+            # owner is sorted, so the first covering candidate per row is the nearest
+            hit_rows, first = np.unique(owner[inside], return_index=True)
+            idx[rows[hit_rows]] = cand[inside][first]
+            dist[rows[hit_rows]] = cand_m[inside][first]
+        return idx, dist
+
+    def tag(self, lat, lon):
+        """Name and category of the nearest covering POI per position, NOT_ANNOTATED if none."""
+        idx, _ = self.nearest(lat, lon)
+        return self.names[idx], self.categories[idx]
+
+
+@lru_cache(maxsize=None)
+def _cached_index(path):
+    return PoiIndex.from_file(path)
+
+
+def default_index(path=POI_CONFIG):
+    """The PoiIndex of `path`, loaded on first use and then reused; importing poi reads nothing."""
+    return _cached_index(Path(path).resolve())
+
+
+def poi_tags(lat, lon, path=POI_CONFIG):
+    """Vectorized POI name and category lookup with the POIs from `path` (POI_CONFIG by default)."""
+    return default_index(path).tag(lat, lon)
@@ -0,0 +1,221 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from grid import METRES_PER_DEGREE_LAT, cell_size_deg
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import load_transformed
+from poi import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+INDEX_COLUMNS = ["licencePlate", "start_time", "end_time", "lat", "lon", "parking_time"]
+META_FILE = "meta.json"
+# Spatial cells of the index; a radius query reads the cells its circle touches
+CELL_SIZE_M = 250.0
+BUCKET_FREQ = "D"
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _cell_keys(iy, ix):
+    # Row-major keys: the cells of one grid row form a contiguous key range
+    return iy.astype(np.int64) * 2**32 + ix.astype(np.int64)
+
+
+class SegmentIndex:
+    """On-disk index of the parking segments for point-in-time and radius/window queries.
+
+    Segments are stored sorted by plate and start time, with the offsets of every
+    plate's run, so "where was plate X at T" is a binary search within one run.
+    For spatial queries every segment is listed under each time bucket it overlaps,
+    sorted by grid cell within the bucket, so a radius/window query reads only the
+    cell ranges around the point in the buckets of the window. All arrays are .npy
+    files opened memory-mapped, so opening the index reads nothing but the metadata.
+    """
+
+    ARRAYS = ["plates", "plate_ptr", "start", "end", "lat", "lon", "parking_time", "row",
+              "bucket_ptr", "cell", "segment"]
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.bucket_s = meta["bucket_s"]
+        self.origin = np.datetime64(meta["origin"], "s")
+        # Same cell layout as the heatmap grid: square in metres at the reference latitude
+        self.dlat, self.dlon = cell_size_deg(meta["cell_m"])
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, segments, path, cell_m=CELL_SIZE_M, bucket_freq=BUCKET_FREQ):
+        """Write the index of `segments` (a transformed DataFrame) to directory `path`."""
+        kept = segments[["start_time", "end_time", "lat", "lon"]].notna().all(axis=1).to_numpy()
+        # Positions of the kept segments among the rows of `segments`
+        positions = np.flatnonzero(kept)
+        segments = segments[kept]
+        plate, plates = pd.factorize(segments["licencePlate"].astype(str), sort=True)
+        start = segments["start_time"].to_numpy().astype("datetime64[s]")
+        end = segments["end_time"].to_numpy().astype("datetime64[s]")
+        order = np.lexsort((start, plate))
+        plate, start, end = plate[order], start[order], end[order]
+        lat = segments["lat"].to_numpy(dtype=np.float64)[order]
+        lon = segments["lon"].to_numpy(dtype=np.float64)[order]
+
+        epoch = pd.Timestamp(0)
+        bucket_s = int((epoch + pd.tseries.frequencies.to_offset(bucket_freq) - epoch).total_seconds())
+        origin = start.min() if len(start) else np.datetime64(0, "s")
+        origin = origin - (origin - np.datetime64(0, "s")).astype(np.int64) % bucket_s
+        first = (start - origin).astype(np.int64) // bucket_s
+        last = (np.maximum(end, start) - origin).astype(np.int64) // bucket_s
+        n_buckets = int(last.max()) + 1 if len(last) else 0
+
+        # One entry per (segment, bucket it overlaps)
+        spans = last - first + 1
+        entry_seg = np.repeat(np.arange(len(start)), spans)
+        entry_bucket = np.repeat(first, spans) + (np.arange(len(entry_seg)) - np.repeat(np.cumsum(spans) - spans, spans))
+        dlat, dlon = cell_size_deg(cell_m)
+        iy = np.floor(lat / dlat).astype(np.int64)
+        ix = np.floor(lon / dlon).astype(np.int64)
+        entry_cell = _cell_keys(iy, ix)[entry_seg]
+        entries = np.lexsort((entry_seg, entry_cell, entry_bucket))
+
+        arrays = {
+            "plates": np.asarray(plates, dtype=str),
+            "plate_ptr": np.searchsorted(plate, np.arange(len(plates) + 1)).astype(np.int64),
+            "start": start,
+            "end": end,
+            "lat": lat,
+            "lon": lon,
+            "parking_time": segments["parking_time"].to_numpy(dtype=np.int64)[order],
+            # Row of the segment in the input, to join back other columns
+            "row": positions[order].astype(np.int64),
+            "bucket_ptr": np.searchsorted(entry_bucket[entries], np.arange(n_buckets + 1)).astype(np.int64),
+            "cell": entry_cell[entries],
+            "segment": entry_seg[entries].astype(np.int32),
+        }
+        meta = {"cell_m": float(cell_m), "bucket_s": bucket_s, "origin": str(origin), "segments": len(start)}
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, values in arrays.items():
+            np.save(path / f"{name}.npy", values)
+        with open(path / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return cls(meta, arrays)
+
+    @classmethod
+    def open(cls, path):
+        """Open an index written by build(); the arrays are memory-mapped, not read."""
+        path = Path(path)
+        with open(path / META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(meta, {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in cls.ARRAYS})
+
+    def _frame(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        plate = np.searchsorted(self.plate_ptr, ids, side="right") - 1
+        return pd.DataFrame({
+            "licencePlate": self.plates[plate],
+            "start_time": pd.to_datetime(self.start[ids]),
+            "end_time": pd.to_datetime(self.end[ids]),
+            "lat": self.lat[ids],
+            "lon": self.lon[ids],
+            "parking_time": self.parking_time[ids],
+            "row": self.row[ids],
+        })
+
+    def _plate_run(self, plate):
+        i = np.searchsorted(self.plates, plate)
+        if i == len(self.plates) or self.plates[i] != plate:
+            return 0, 0
+        return int(self.plate_ptr[i]), int(self.plate_ptr[i + 1])
+
+    def segments(self, plate, start=None, end=None):
+        """Segments of `plate` that overlap [start, end), in time order."""
+        lo, hi = self._plate_run(plate)
+        # Segments of one plate do not overlap, so both starts and ends are sorted within the run
+        first, last = lo, hi
+        if start is not None:
+            first = lo + int(np.searchsorted(self.end[lo:hi], np.datetime64(pd.Timestamp(start), "s"), side="left"))
+        if end is not None:
+            last = lo + int(np.searchsorted(self.start[lo:hi], np.datetime64(pd.Timestamp(end), "s"), side="left"))
+        return self._frame(np.arange(first, max(first, last)))
+
+    def at(self, plate, when):
+        """The segment where `plate` was parked at `when`, or None if it was moving or unknown."""
+        lo, hi = self._plate_run(plate)
+        when = np.datetime64(pd.Timestamp(when), "s")
+        i = lo + int(np.searchsorted(self.start[lo:hi], when, side="right")) - 1
+        if i < lo or self.end[i] < when:
+            return None
+        return self._frame([i]).iloc[0]
+
+    def near(self, lat, lon, radius_m, start, end):
+        """Segments within `radius_m` metres of (lat, lon) that overlap [start, end), nearest first."""
+        start = np.datetime64(pd.Timestamp(start), "s")
+        end = np.datetime64(pd.Timestamp(end), "s")
+        first = max(int((start - self.origin).astype(np.int64) // self.bucket_s), 0)
+        last = min(int((end - self.origin).astype(np.int64) // self.bucket_s), len(self.bucket_ptr) - 2)
+
+        # Longitude degrees shrink with latitude, so size the window at the query point
+        rlat = radius_m / METRES_PER_DEGREE_LAT
+        rlon = radius_m / (METRES_PER_DEGREE_LAT * np.cos(np.radians(min(abs(lat) + rlat, 89.0))))
+        rows = np.arange(np.floor((lat - rlat) / self.dlat), np.floor((lat + rlat) / self.dlat) + 1, dtype=np.int64)
+        x0, x1 = np.floor((lon - rlon) / self.dlon), np.floor((lon + rlon) / self.dlon)
+        row_lo = _cell_keys(rows, np.full(len(rows), x0))
+        row_hi = _cell_keys(rows, np.full(len(rows), x1))
+
+        parts = []
+        for bucket in range(first, last + 1):
+            lo, hi = int(self.bucket_ptr[bucket]), int(self.bucket_ptr[bucket + 1])
+            cells = self.cell[lo:hi]
+            starts = np.searchsorted(cells, row_lo, side="left")
+            stops = np.searchsorted(cells, row_hi, side="right")
+            for a, b in zip(starts.tolist(), stops.tolist()):
+                if b > a:
+                    parts.append(self.segment[lo + a:lo + b])
+        if not parts:
+            return self._frame([]).assign(distance_m=np.array([], dtype=np.float64))
+
+        ids = np.unique(np.concatenate(parts))
+        ids = ids[(self.start[ids] < end) & (self.end[ids] >= start)]
+        distance = _haversine_m(lat, lon, self.lat[ids], self.lon[ids])
+        inside = distance <= radius_m
+        out = self._frame(ids[inside]).assign(distance_m=distance[inside])
+        return out.sort_values(["distance_m", "start_time"], kind="stable").reset_index(drop=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the spatiotemporal index of the parking segments.")
+    parser.add_argument('--input', type=str, required=True, help="Transformed CSV from data_transformation.py.")
+    parser.add_argument('--output', type=str, required=True, help="Output directory of the index.")
+    parser.add_argument('--cell-size', type=float, default=CELL_SIZE_M, help="Spatial cell size in metres.")
+    parser.add_argument('--bucket', type=str, default=BUCKET_FREQ, help="Time bucket of the spatial index, e.g. D or 6h.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = Metrics.from_args("segment_index", args)
+    with metrics.phase("load") as phase:
+        segments = load_transformed(args.input, INDEX_COLUMNS)
+        phase.add(rows=len(segments))
+    with metrics.phase("build") as phase:
+        index = SegmentIndex.build(segments, args.output, args.cell_size, args.bucket)
+        phase.add(rows=len(segments))
+    metrics.close()
+    logger.info(
+        f"Indexed {index.meta['segments']} segments of {len(index.plates)} plates in {len(index.bucket_ptr) - 1} "
+        f"buckets ({len(index.cell)} entries) to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
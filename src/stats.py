@@ -1,40 +1,255 @@
-import pandas as pd
 import argparse
+import io
 import logging
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from annotation import car_types
+from data_transformation import normalize_plates
+from instrumentation import Metrics, add_metrics_arguments
+from loaders import (
+    COMBINED_DATETIMES,
+    COMBINED_SCHEMA,
+    TRANSFORMED_DATETIMES,
+    TRANSFORMED_SCHEMA,
+    read_typed_csv,
+)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    parser = argparse.ArgumentParser(description="")
-    parser.add_argument("--input", type=str, required=True, help="Path to the input data file (CSV)")
+BLOCK_SIZE = 64 * 1024 * 1024
+# Bytes read at a time when looking for the block boundaries
+SCAN_SIZE = 16 * 1024 * 1024
+MAX_WORKERS = 4
+SKETCH_ACCURACY = 0.01
+# A scrape interval counts as missed if the next snapshot is this many intervals late
+GAP_FACTOR = 1.5
+QUANTILES = (0.5, 0.9, 0.99)
 
-    args = parser.parse_args()
 
-    df = pd.read_csv(args.input)
+class QuantileSketch:
+    """Mergeable quantile sketch of non-negative values with relative error `accuracy`.
+
+    Values are counted in logarithmic buckets (as in DDSketch), so memory depends on
+    the value range, not on the number of values, and two sketches merge by adding counts.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.counts = {}
+        self.zeros = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def merge(self, other):
+        self.zeros += other.zeros
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.counts.values())
+
+    def quantile(self, q):
+        total = self.count
+        if total == 0:
+            return float("nan")
+        rank = q * (total - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key] in relative terms
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.counts) / (self.gamma + 1)
+
+
+class FleetStats:
+    """Partial fleet statistics of a part of the input; partials of any parts merge into the total."""
+
+    def __init__(self):
+        self.rows = 0
+        # Per plate: number of rows and the car type of its first row
+        self.plate_rows = pd.Series(dtype=np.int64)
+        self.plate_type = pd.Series(dtype=object)
+        self.scrape_times = np.array([], dtype="datetime64[s]")
+        self.parking_time = QuantileSketch()
+
+    def update(self, chunk):
+        """Add one chunk of the combined snapshots or of the parking segments."""
+        self.rows += len(chunk)
+        if "parking_time" in chunk:
+            plates, types = chunk["licencePlate"].astype(str), chunk["car_type"].astype(str)
+            self.parking_time.add(chunk["parking_time"])
+        else:
+            plates = normalize_plates(chunk["licencePlate"]).astype(str)
+            types = pd.Series(car_types(chunk["vehicleTypeId"]), index=chunk.index)
+            times = chunk["file_datetime"].dropna().unique().to_numpy().astype("datetime64[s]")
+            self.scrape_times = np.union1d(self.scrape_times, times)
+        self.merge_plates(plates.value_counts(), types.groupby(plates.to_numpy(), sort=False).first())
+        return self
 
-    logger.info(f"Loaded data with {len(df)} rows from {args.input}")
+    def merge_plates(self, rows, types):
+        self.plate_rows = self.plate_rows.add(rows, fill_value=0).astype(np.int64)
+        self.plate_type = self.plate_type.combine_first(types) if len(self.plate_type) else types
 
-    # Unique number plates
-    unique_plates = df['licencePlate'].nunique()
-    logger.info(f"Number of unique licence plates: {unique_plates}")
+    def merge(self, other):
+        """Add a partial of a later part of the input."""
+        self.rows += other.rows
+        self.merge_plates(other.plate_rows, other.plate_type)
+        self.scrape_times = np.union1d(self.scrape_times, other.scrape_times)
+        self.parking_time.merge(other.parking_time)
+        return self
 
-    per_vehicle = df.groupby("licencePlate", sort=False)["car_type"].first()
+    def gaps(self):
+        """Scrape interval and the gaps between consecutive snapshots longer than GAP_FACTOR intervals."""
+        if len(self.scrape_times) < 3:
+            return None, np.array([], dtype="timedelta64[s]")
+        diffs = np.diff(self.scrape_times)
+        interval = np.median(diffs.astype(np.int64))
+        return np.timedelta64(int(interval), "s"), diffs[diffs.astype(np.int64) > GAP_FACTOR * interval]
 
-    counts = per_vehicle.value_counts()
+    def report(self):
+        unique_plates = len(self.plate_rows)
+        logger.info(f"Number of unique licence plates: {unique_plates}")
 
-    car_count = int(counts.get("car", 0))
-    van_count = int(counts.get("van", 0))
-    total_count = car_count + van_count
+        counts = self.plate_type.value_counts()
+        car_count = int(counts.get("car", 0))
+        van_count = int(counts.get("van", 0))
+        total_count = car_count + van_count
+        if total_count:
+            logger.info(f"Total number of cars: {car_count} out of {total_count} vehicles, which is {car_count / total_count:.2%}")
+            logger.info(f"Total number of vans: {van_count} out of {total_count} vehicles, which is {van_count / total_count:.2%}")
 
-    logger.info(f"Total number of cars: {car_count} out of {total_count} vehicles, which is {car_count / total_count:.2%}")
-    logger.info(f"Total number of vans: {van_count} out of {total_count} vehicles, which is {van_count / total_count:.2%}")
+        what = "parking segments" if self.parking_time.count else "snapshots"
+        if unique_plates:
+            per_plate = self.plate_rows
+            logger.info(
+                f"{what.capitalize()} per plate: min {per_plate.min()}, median {per_plate.median():g}, max {per_plate.max()}"
+            )
 
+        interval, gaps = self.gaps()
+        if interval is not None:
+            missed = int(np.sum(np.round(gaps / interval) - 1))
+            logger.info(
+                f"{len(self.scrape_times)} scrapes from {self.scrape_times[0]} to {self.scrape_times[-1]}, "
+                f"every {interval.astype(int)}s; {len(gaps)} gaps with about {missed} missed scrapes"
+                + (f", the longest {gaps.max().astype(int)}s" if len(gaps) else "")
+            )
 
-    
+        if self.parking_time.count:
+            quantiles = ", ".join(f"p{q * 100:g} {self.parking_time.quantile(q):.0f}" for q in QUANTILES)
+            logger.info(f"Parking time (minutes): {quantiles}")
+
+
+def _byte_ranges(path, block_size):
+    """Offsets of record-aligned blocks of about `block_size` bytes after the header line.
+
+    build_csv quotes fields that contain a newline, so a newline only ends a record
+    outside quotes, i.e. after an even number of quote characters (an escaped "" counts
+    twice). One sequential pass that counts quotes finds the block boundaries.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        offset = start = len(header)
+        boundaries = [start]
+        target = start + block_size
+        quoted = False
+        while chunk := f.read(SCAN_SIZE):
+            i = 0
+            while (t := max(target - offset, i)) < len(chunk):
+                quoted ^= bool(chunk.count(b'"', i, t) & 1)
+                i = t
+                j = chunk.find(b"\n", i)
+                while j != -1:
+                    quoted ^= bool(chunk.count(b'"', i, j) & 1)
+                    i = j
+                    if not quoted:
+                        break
+                    j = chunk.find(b"\n", j + 1)
+                if j == -1:
+                    break
+                boundaries.append(offset + j + 1)
+                target = offset + j + 1 + block_size
+                i = j + 1
+            quoted ^= bool(chunk.count(b'"', i) & 1)
+            offset += len(chunk)
+    ends = boundaries[1:] + [offset]
+    return header, [(a, b) for a, b in zip(boundaries, ends) if b > a]
+
+
+def _read_block(path, header, start, end):
+    """The CSV records in [start, end), a range from _byte_ranges, with the header line in front."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return header + f.read(end - start)
+
+
+def _block_stats(path, header, start, end, combined):
+    """FleetStats of the lines in one block of the file."""
+    buffer = io.BytesIO(_read_block(path, header, start, end))
+    if combined:
+        chunk = read_typed_csv(buffer, COMBINED_SCHEMA, COMBINED_DATETIMES, ["licencePlate", "vehicleTypeId", "file_datetime"])
+    else:
+        chunk = read_typed_csv(buffer, TRANSFORMED_SCHEMA, TRANSFORMED_DATETIMES, ["licencePlate", "car_type", "parking_time"])
+    return FleetStats().update(chunk)
+
+
+def fleet_stats(path, block_size=BLOCK_SIZE, max_workers=MAX_WORKERS):
+    """Stream `path` in blocks, summarise each block in a worker process and merge the partials."""
+    header, ranges = _byte_ranges(path, block_size)
+    columns = {c.strip() for c in header.decode().rstrip("\r\n").split(",")}
+    combined = "file_datetime" in columns
+    stats = FleetStats()
+    # At most this many blocks are in flight, so finished partials do not pile up
+    window = 2 * max_workers
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(_block_stats, path, header, start, end, combined))
+            if len(pending) >= window:
+                # Merge in file order so the first car type of a plate stays the first one in the file
+                stats.merge(pending.popleft().result())
+        while pending:
+            stats.merge(pending.popleft().result())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet statistics of the combined snapshot CSV or the transformed CSV.")
+    parser.add_argument("--input", type=str, required=True, help="Path to the input data file (CSV)")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Bytes of the file each worker reads at a time.")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Number of worker processes.")
+
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO)
+    metrics = Metrics.from_args("stats", args)
+    with metrics.phase("scan") as phase:
+        stats = fleet_stats(args.input, args.block_size, args.max_workers)
+        phase.add(rows=stats.rows, bytes=os.path.getsize(args.input))
+    logger.info(f"Loaded data with {stats.rows} rows from {args.input}")
+    with metrics.phase("report"):
+        stats.report()
+    metrics.close()
 
-    
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from pathlib import Path
+
+import pandas as pd
+
+from build_csv import (
+    BATCH_SIZE,
+    MAX_WORKERS,
+    _iter_batches,
+    _list_snapshots,
+    _parse_datetime_from_filename,
+    _read_single_file,
+    _snapshot_sort_key,
+)
+from data_transformation import MOVE_THRESHOLD, annotate_segments
+from instrumentation import Metrics, add_metrics_arguments
+from poi import POI_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Raw snapshot keys the segmentation needs
+SNAPSHOT_COLUMNS = frozenset(["licencePlate", "lat", "lon", "zipCode", "vehicleTypeId"])
+
+SEGMENT_COLUMNS = ["licencePlate", "start_time", "end_time", "lat", "lon", "parking_time", "vehicleTypeId", "zipCode"]
+
+_ZIP_RE = re.compile(r"(\d{4})")
+
+
+def normalize_plate(plate) -> str:
+    """Row-level version of data_transformation.normalize_plates."""
+    return str(float("nan") if plate is None else plate).lower().replace(" ", "").strip()
+
+
+def extract_zip_code(zip_code) -> int:
+    """Row-level version of data_transformation.extract_zip_codes."""
+    m = _ZIP_RE.search(str(zip_code))
+    return int(m.group(1)) if m else -1
+
+
+def _coord(value) -> float:
+    return float("nan") if value is None else float(value)
+
+
+class SegmentTracker:
+    """Online parking segmentation over snapshots fed in timestamp order.
+
+    Applies the same boundary rule as data_transformation.py: a segment ends when the
+    plate's position moves more than `thr` in lat or lon from its previous sighting.
+    A car that disappears keeps its segment open, since the batch logic would continue
+    it if the car reappears at the same spot; open segments are closed by flush().
+    Memory is bounded by the number of plates, not the number of snapshots.
+    """
+
+    def __init__(self, thr: float = MOVE_THRESHOLD):
+        self.thr = thr
+        # plate -> [start_time, lat, lon, vehicleTypeId, zipCode, last_time, last_lat, last_lon]
+        self.open: dict[str, list] = {}
+
+    def update(self, file_dt: datetime, rows: list[dict]) -> list[tuple]:
+        """Feed one snapshot; returns the segments it closed as SEGMENT_COLUMNS tuples."""
+        closed = []
+        thr = self.thr
+        for row in rows:
+            plate = normalize_plate(row.get("licencePlate"))
+            lat = _coord(row.get("lat"))
+            lon = _coord(row.get("lon"))
+            seg = self.open.get(plate)
+            if seg is not None:
+                if abs(lat - seg[6]) > thr or abs(lon - seg[7]) > thr:
+                    closed.append(self._segment(plate, seg))
+                else:
+                    seg[5], seg[6], seg[7] = file_dt, lat, lon
+                    continue
+            self.open[plate] = [
+                file_dt, lat, lon,
+                str(row.get("vehicleTypeId")), extract_zip_code(row.get("zipCode")),
+                file_dt, lat, lon,
+            ]
+        return closed
+
+    def flush(self) -> list[tuple]:
+        """Close and return every open segment, e.g. at the end of the input."""
+        closed = [self._segment(plate, seg) for plate, seg in self.open.items()]
+        self.open.clear()
+        return closed
+
+    @staticmethod
+    def _segment(plate: str, seg: list) -> tuple:
+        start, lat, lon, vehicle_type, zip_code, end = seg[:6]
+        # Python's round() rounds half to even, like np.round in data_transformation.py
+        parking_time = round((end - start).total_seconds() / 60)
+        return plate, start, end, lat, lon, parking_time, vehicle_type, zip_code
+
+
+def _write_segments(segments: list[tuple], output_path: Path, header: bool, pois: str | Path = POI_CONFIG) -> int:
+    """Annotate closed segments and append them to the output CSV; returns rows written."""
+    grouped = pd.DataFrame.from_records(segments, columns=SEGMENT_COLUMNS)
+    grouped = annotate_segments(grouped, pois)
+    grouped.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+    return len(grouped)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Build parking segments straight from raw snapshots, without the combined CSV."
+    )
+    parser.add_argument('--input', type=str, required=True,
+                        help="Directory of .json/.json.gz snapshots, or a .zip/.tar(.gz/.zst) archive of them.")
+    parser.add_argument('--output', type=str, required=True, help="Output CSV file path (same format as data_transformation.py).")
+    parser.add_argument('--thr', type=float, default=MOVE_THRESHOLD, help="Lat/lon change that counts as a move.")
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS, help="Maximum number of worker threads or processes.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of files to process in each batch.")
+    parser.add_argument('--executor', choices=["thread", "process"], default="thread",
+                        help="Parse snapshots in worker threads or processes.")
+    parser.add_argument('--progress', action='store_true', help="Log progress every second instead of every 30 seconds.")
+    parser.add_argument('--pois', type=str, default=str(POI_CONFIG), help="JSON file of points of interest to tag segments with.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = Metrics.from_args("stream_segments", args)
+    if args.progress:
+        metrics.progress_interval_s = 1.0
+    input_path = Path(args.input)
+    output_path = Path(args.output)
+    with metrics.phase("list"):
+        files = sorted(_list_snapshots(input_path), key=_snapshot_sort_key)
+    logger.info(f"Found {len(files)} JSON files in {input_path}")
+
+    tracker = SegmentTracker(args.thr)
+    progress = metrics.progress("stream", len(files), "files")
+    header = True
+    written = 0
+
+    executor_cls = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+    with metrics.phase("stream") as stream, executor_cls(max_workers=args.max_workers) as executor:
+        for batch_files in _iter_batches(input_path, files, args.batch_size):
+            chunksize = max(1, len(batch_files) // (args.max_workers * 4))
+            closed = []
+            # map() yields in submission order, i.e. snapshot-timestamp order
+            for result in executor.map(_read_single_file, batch_files, repeat(SNAPSHOT_COLUMNS), chunksize=chunksize):
+                progress.update()
+                if result is None:
+                    continue
+                data, filename, _ = result
+                file_dt = _parse_datetime_from_filename(Path(filename))
+                if file_dt is None:
+                    logger.warning(f"Skipping {filename}: no timestamp in the file name")
+                    continue
+                with metrics.phase("track") as track:
+                    closed.extend(tracker.update(datetime.fromisoformat(file_dt), data))
+                    track.add(rows=len(data))
+                stream.add(rows=len(data))
+            if closed:
+                with metrics.phase("write") as write:
+                    written += _write_segments(closed, output_path, header, args.pois)
+                    write.add(rows=len(closed))
+                header = False
+    closed = tracker.flush()
+    if closed or header:
+        with metrics.phase("write") as write:
+            written += _write_segments(closed, output_path, header, args.pois)
+            write.add(rows=len(closed))
+
+    logger.info(f"Saved {written} parking segments to {output_path}")
+    metrics.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import gzip
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EXAMPLE_SNAPSHOT = Path(__file__).resolve().parent.parent / "data" / "example.json"
+SCRAPE_INTERVAL_S = 120
+START_TIME = "2025-08-01 00:00:00"
+
+# Park/move behaviour: parked cars are rented at random and reappear elsewhere
+MEAN_PARKED_MIN = 180
+MEAN_RENTAL_MIN = 35
+RELOCATION_SIGMA_M = 1500.0
+# Parked positions wobble by about 1 m between scrapes, well below MOVE_THRESHOLD
+GPS_JITTER_DEG = 1e-5
+FUEL_PER_RENTAL_MIN = 0.3
+# Fields that describe where a car is; they follow the car to the hotspot it was left at
+LOCATION_FIELDS = ("address", "zipCode", "city", "locationId")
+
+# Plate formats seen in the feed, e.g. 'CL 91 936', 'EJ24277' and 'DE 51 770 ' (trailing space)
+PLATE_STYLES = ("spaced", "compact", "trailing")
+PLATE_STYLE_WEIGHTS = (0.55, 0.4, 0.05)
+# Share of rows whose plate is written in another style than the car's usual one
+PLATE_QUIRK_RATE = 0.01
+
+
+def _format_plate(letters, digits, style):
+    if style == "compact":
+        return f"{letters}{digits}"
+    plate = f"{letters} {digits[:2]} {digits[2:]}"
+    return plate + " " if style == "trailing" else plate
+
+
+class SyntheticFleet:
+    """N cars scraped every SCRAPE_INTERVAL_S seconds, shaped like the snapshots of data/example.json.
+
+    Every car copies the static fields (vehicle type, pricing, city, ...) of a car of the
+    example snapshot. Parked cars are rented with a rate of 1 / MEAN_PARKED_MIN, vanish from
+    the feed while rented like in the real API, and reappear around another example position.
+    """
+
+    def __init__(self, n_cars, seed=0, example=EXAMPLE_SNAPSHOT, interval_s=SCRAPE_INTERVAL_S):
+        with open(example, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+        self.rng = np.random.default_rng(seed)
+        self.interval_s = interval_s
+        self.n_cars = n_cars
+        self.template = self.rng.integers(0, len(templates), n_cars)
+        self.templates = templates
+        self.hotspots = np.array([[t["lat"], t["lon"]] for t in templates])
+
+        prefixes = sorted({t["licencePlate"].replace(" ", "")[:2] for t in templates})
+        letters = self.rng.choice(prefixes, n_cars)
+        # Distinct 5-digit numbers, so no two cars share a plate
+        numbers = self.rng.permutation(90000)[:n_cars] + 10000 if n_cars <= 90000 else np.arange(n_cars) + 10000
+        self.digits = [str(n) for n in numbers]
+        self.letters = letters.tolist()
+        self.style = self.rng.choice(len(PLATE_STYLES), n_cars, p=PLATE_STYLE_WEIGHTS)
+
+        # Example car whose position (and address fields) a car was last left at
+        self.spot = self.template.copy()
+        self.lat = self.hotspots[self.template, 0].copy()
+        self.lon = self.hotspots[self.template, 1].copy()
+        self.fuel = self.rng.integers(20, 101, n_cars).astype(np.float64)
+        # Snapshots left until a rented car reappears; 0 for parked cars
+        self.rented = np.zeros(n_cars, dtype=np.int64)
+
+    def _relocate(self, cars):
+        self.spot[cars] = self.rng.integers(0, len(self.hotspots), len(cars))
+        spots = self.hotspots[self.spot[cars]]
+        offset = self.rng.normal(0, RELOCATION_SIGMA_M / 111_195.0, (len(cars), 2))
+        self.lat[cars] = spots[:, 0] + offset[:, 0]
+        self.lon[cars] = spots[:, 1] + offset[:, 1] / np.cos(np.radians(spots[:, 0]))
+
+    def step(self):
+        """Advance one scrape interval and return the rows of the snapshot."""
+        interval_min = self.interval_s / 60
+        returning = np.flatnonzero(self.rented == 1)
+        self._relocate(returning)
+        self.fuel[returning] = np.maximum(self.fuel[returning] - FUEL_PER_RENTAL_MIN * MEAN_RENTAL_MIN, 5)
+        self.fuel[self.fuel < 15] = 100  # charged overnight by the operator
+        self.rented[self.rented > 0] -= 1
+
+        parked = self.rented == 0
+        leaving = parked & (self.rng.random(self.n_cars) < interval_min / MEAN_PARKED_MIN)
+        self.rented[leaving] = self.rng.geometric(interval_min / MEAN_RENTAL_MIN, int(leaving.sum())) + 1
+        visible = np.flatnonzero(self.rented == 0)
+
+        jitter = self.rng.uniform(-GPS_JITTER_DEG, GPS_JITTER_DEG, (len(visible), 2))
+        quirk = self.rng.random(len(visible)) < PLATE_QUIRK_RATE
+        rows = []
+        for k, car in enumerate(visible.tolist()):
+            row = dict(self.templates[self.template[car]])
+            spot = self.templates[self.spot[car]]
+            row.update((field, spot[field]) for field in LOCATION_FIELDS if field in spot)
+            style = PLATE_STYLES[(self.style[car] + quirk[k]) % len(PLATE_STYLES)]
+            row["carId"] = car + 1
+            row["licencePlate"] = _format_plate(self.letters[car], self.digits[car], style)
+            row["lat"] = round(float(self.lat[car] + jitter[k, 0]), 6)
+            row["lon"] = round(float(self.lon[car] + jitter[k, 1]), 6)
+            row["fuelLevel"] = int(self.fuel[car])
+            rows.append(row)
+        return rows
+
+
+def generate(output_dir, n_cars, n_snapshots, seed=0, start=START_TIME, interval_s=SCRAPE_INTERVAL_S, compress=False):
+    """Write `n_snapshots` snapshot files of `n_cars` cars, named like the scraper's 'cars_YYYYMMDD_HHMMSS.json'.
+
+    Returns the number of rows written.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fleet = SyntheticFleet(n_cars, seed, interval_s=interval_s)
+    times = pd.date_range(start, periods=n_snapshots, freq=pd.Timedelta(seconds=interval_s))
+    rows = 0
+    for ts in times:
+        snapshot = fleet.step()
+        name = f"cars_{ts:%Y%m%d_%H%M%S}.json"
+        data = json.dumps(snapshot, ensure_ascii=False).encode("utf-8")
+        if compress:
+            with gzip.open(output_dir / (name + ".gz"), "wb") as f:
+                f.write(data)
+        else:
+            (output_dir / name).write_bytes(data)
+        rows += len(snapshot)
+    return rows
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Generate synthetic car snapshots in the schema of data/example.json.")
+    parser.add_argument('--output', type=str, required=True, help="Directory for the snapshot files.")
+    parser.add_argument('--cars', type=int, default=1000, help="Number of cars in the fleet.")
+    parser.add_argument('--snapshots', type=int, default=720, help="Number of snapshots (one per scrape interval).")
+    parser.add_argument('--interval', type=int, default=SCRAPE_INTERVAL_S, help="Seconds between snapshots.")
+    parser.add_argument('--start', type=str, default=START_TIME, help="Time of the first snapshot.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same files.")
+    parser.add_argument('--gzip', action="store_true", help="Write .json.gz files.")
+    args = parser.parse_args()
+
+    rows = generate(args.output, args.cars, args.snapshots, args.seed, args.start, args.interval, args.gzip)
+    logger.info(f"Wrote {args.snapshots} snapshots with {rows} rows of {args.cars} cars to {args.output}")
+
+
+if __name__ == "__main__":
+    main()